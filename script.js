@@ -13,19 +13,50 @@ class BBSThemeTool {
             { name: 'DOS Classic', bg: '#000000', text: '#c0c0c0', accent: '#ffff00', border: '#808080' }
         ];
         
+        this.searchIndex = null;
+        this.themeItems = [];
         this.currentTheme = this.themes[0];
         this.init();
     }
 
-    init() {
+    async init() {
+        await this.loadCatalog();
         this.populateThemeList();
         this.bindEvents();
         this.applyTheme();
     }
 
+    async loadCatalog() {
+        // Use the catalog written by theme_catalog_build.py when it has been published
+        try {
+            const response = await fetch('catalog/catalog.json');
+            if (!response.ok) {
+                return;
+            }
+            const catalog = await response.json();
+            if (!catalog.themes || catalog.themes.length === 0) {
+                return;
+            }
+            this.themes = catalog.themes.map(theme => ({
+                name: theme.name.replace(/\.zip$/, ''),
+                bg: theme.bg,
+                text: theme.text,
+                accent: theme.accent,
+                border: theme.border,
+                thumbnail: theme.thumbnails.webp || theme.thumbnails.png || null
+            }));
+            this.searchIndex = catalog.index;
+            this.currentTheme = this.themes[0];
+        } catch (err) {
+            console.log('Theme catalog not available, using built-in themes:', err);
+        }
+    }
+
     populateThemeList() {
         const themeList = document.getElementById('themeList');
         themeList.innerHTML = '';
+        this.themeItems = [];
+        const fragment = document.createDocumentFragment();
         
         this.themes.forEach((theme, index) => {
             const themeItem = document.createElement('div');
@@ -38,8 +69,11 @@ class BBSThemeTool {
             }
             
             themeItem.addEventListener('click', () => this.selectTheme(index));
-            themeList.appendChild(themeItem);
+            this.themeItems.push(themeItem);
+            fragment.appendChild(themeItem);
         });
+        
+        themeList.appendChild(fragment);
     }
 
     bindEvents() {
@@ -99,10 +133,10 @@ class BBSThemeTool {
 
     selectTheme(index) {
         // Update selected theme in list
-        document.querySelectorAll('.theme-item').forEach(item => {
+        this.themeItems.forEach(item => {
             item.classList.remove('selected');
         });
-        document.querySelector(`[data-index="${index}"]`).classList.add('selected');
+        this.themeItems[index].classList.add('selected');
         
         // Update current theme
         this.currentTheme = { ...this.themes[index] };
@@ -132,6 +166,7 @@ class BBSThemeTool {
         preview.style.setProperty('--text-color', this.currentTheme.text);
         preview.style.setProperty('--accent-color', this.currentTheme.accent);
         preview.style.setProperty('--border-color', this.currentTheme.border);
+        preview.style.setProperty('--bg-image', this.currentTheme.thumbnail ? `url("catalog/${this.currentTheme.thumbnail}")` : 'none');
         
         // Apply border
         if (enableBorder) {
@@ -156,17 +191,61 @@ class BBSThemeTool {
     }
 
     filterThemes(searchTerm) {
-        const themeItems = document.querySelectorAll('.theme-item');
-        const term = searchTerm.toLowerCase();
+        const matches = this.searchThemes(searchTerm);
+        
+        this.themeItems.forEach((item, index) => {
+            item.style.display = matches === null || matches.has(index) ? 'block' : 'none';
+        });
+    }
+
+    searchThemes(searchTerm) {
+        // Returns the matching theme indices, or null when everything matches
+        const terms = searchTerm.toLowerCase().match(/[a-z0-9]+/g);
+        if (!terms) {
+            return null;
+        }
         
-        themeItems.forEach(item => {
-            const themeName = item.textContent.toLowerCase();
-            if (themeName.includes(term)) {
-                item.style.display = 'block';
+        if (!this.searchIndex) {
+            const term = searchTerm.toLowerCase();
+            const matches = new Set();
+            this.themes.forEach((theme, index) => {
+                if (theme.name.toLowerCase().includes(term)) {
+                    matches.add(index);
+                }
+            });
+            return matches;
+        }
+        
+        let result = null;
+        for (const term of terms) {
+            const matches = this.lookupPrefix(term);
+            result = result === null ? matches : new Set([...result].filter(id => matches.has(id)));
+            if (result.size === 0) {
+                break;
+            }
+        }
+        return result;
+    }
+
+    lookupPrefix(prefix) {
+        // Binary search the sorted token list for the first token >= prefix
+        const index = this.searchIndex;
+        let low = 0;
+        let high = index.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (index[mid][0] < prefix) {
+                low = mid + 1;
             } else {
-                item.style.display = 'none';
+                high = mid;
             }
-        });
+        }
+        
+        const matches = new Set();
+        for (let i = low; i < index.length && index[i][0].startsWith(prefix); i++) {
+            index[i][1].forEach(id => matches.add(id));
+        }
+        return matches;
     }
 
     exportTheme() {
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+from PIL import Image
+
+from theme_images import ScaledBackgroundCache, load_preview, render_preview
+
+def png_bytes(img: Image.Image) -> bytes:
+    output = io.BytesIO()
+    img.save(output, "PNG")
+    return output.getvalue()
+
+def gradient(size=(1600, 900)) -> Image.Image:
+    img = Image.new("RGB", size)
+    img.putdata([(x * 255 // size[0], y * 255 // size[1], 128) for y in range(size[1]) for x in range(size[0])])
+    return img
+
+def sixteen_bit_ramp(size=(1600, 900)) -> Image.Image:
+    """Horizontal ramp over the full 16 bit range"""
+    img = Image.new("I;16", size)
+    img.putdata([x * 65535 // (size[0] - 1) for _ in range(size[1]) for x in range(size[0])])
+    return img
+
+@pytest.fixture(params=["P", "P-transparent", "1", "I;16", "LA"])
+def background(request) -> bytes:
+    img = gradient()
+    if request.param == "P":
+        img = img.quantize(colors=64)
+    elif request.param == "P-transparent":
+        img = img.quantize(colors=64)
+        img.info["transparency"] = 0
+    elif request.param == "I;16":
+        img = sixteen_bit_ramp()
+    else:
+        img = img.convert(request.param)
+    return png_bytes(img)
+
+def test_preview_of_any_png_mode(background):
+    preview = load_preview(background, (400, 200))
+    assert preview.mode == "RGBA" and preview.size == (400, 200)
+    assert render_preview(background, 0xFF102030, (400, 200)).size == (400, 200)
+
+def test_downscale_of_any_png_mode(background, tmp_path):
+    scaled = ScaledBackgroundCache(cache_dir=str(tmp_path)).scaled(background, (640, 360))
+    assert Image.open(io.BytesIO(scaled)).size == (640, 360)
+
+def test_sixteen_bit_backgrounds_keep_their_range(tmp_path):
+    background = png_bytes(sixteen_bit_ramp())
+    assert Image.open(io.BytesIO(background)).getextrema()[1] > 255
+
+    low, high = load_preview(background, (400, 200)).convert("L").getextrema()
+    assert low < 16 and high > 240
+    scaled = ScaledBackgroundCache(cache_dir=str(tmp_path)).scaled(background, (640, 360))
+    low, high = Image.open(io.BytesIO(scaled)).convert("L").getextrema()
+    assert low < 16 and high > 240
+
+def test_optimized_export_can_be_previewed_and_scaled(tmp_path):
+    import json
+    import theme_operations
+    from theme_images import PngOptimizer
+
+    config_path = tmp_path / "config"
+    (config_path / "settings").mkdir(parents=True)
+    (config_path / "assets" / "textures").mkdir(parents=True)
+    (config_path / "theme").mkdir()
+    (config_path / "settings" / "bbs.json").write_text(
+        json.dumps({"appearance": {"primary_color": -1}, "background": {"color": -16777216}}))
+    # Few colors, so the optimizer reduces it to a palette PNG
+    background = gradient((3840, 2160)).quantize(colors=16).convert("RGB")
+    (config_path / "assets" / "textures" / "background.png").write_bytes(png_bytes(background))
+
+    theme_operations.export_theme(str(config_path), "optimized", "zip", optimize_assets=True,
+                                  png_optimizer=PngOptimizer(cache_dir=str(tmp_path / "optimized")))
+    _, assets = theme_operations.read_theme(str(config_path / "theme"), "optimized.zip")
+    assert Image.open(io.BytesIO(assets["background.png"])).mode == "P"
+
+    assert load_preview(assets["background.png"], (400, 200)).size == (400, 200)
+    scaled = ScaledBackgroundCache(cache_dir=str(tmp_path / "scaled")).scaled(assets["background.png"], (1920, 1080))
+    assert Image.open(io.BytesIO(scaled)).size == (1920, 1080)
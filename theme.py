@@ -1,16 +1,52 @@
+import time
+STARTUP_CLOCK = time.perf_counter()
+
 import os
+import sys
 import json
-import shutil
+import argparse
+import functools
+import importlib.util
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageColor
+from tkinter import filedialog, messagebox, ttk, simpledialog
+from PIL import Image, ImageTk
 import tkinter.font as tkFont
 import logging
-import glob
 from datetime import datetime
 import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
 from typing import Dict, List, Optional, Tuple
 
+from theme_catalog import cache_path, describe_theme, format_size, list_themes, theme_category
+from theme_images import (TARGET_SIZES, ImageTooLargeError, PngOptimizer, ScaledBackgroundCache, ThumbnailLoader,
+                          load_preview, load_theme_thumbnail, open_bounded, reduced, render_preview)
+from theme_io import DEFAULT_BANDWIDTH, INTERACTIVE, PREFETCH, IOScheduler, read_file
+from theme_layers import ThemeResolver
+import theme_operations
+from theme_watchdog import StallWatchdog
+
+# NumPy is optional, palette and similarity features are disabled without it.
+# Modules needing it are imported on first use to keep startup fast.
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# Remembers the last used config path between sessions
+SETTINGS_FILE = cache_path("settings.json")
+
+# Where main-loop stalls are reported when the tool exits
+STALL_REPORT_FILE = cache_path("stall-report.json")
+
+# Themes described per metadata batch
+METADATA_BATCH = 32
+
+# Size of the background preview in the preview window
+PREVIEW_SIZE = (400, 200)
+
+# Gallery cell and thumbnail sizes, and how many decoded thumbnails are kept
+GALLERY_CELL = (200, 160)
+GALLERY_THUMB = (180, 101)
+GALLERY_MAX_THUMBNAILS = 300
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,6 +64,55 @@ class ColorScheme:
     BORDER = "#404040"           # Border color
     HOVER = "#333333"            # Hover state
 
+def watched(operation: str):
+    """Name a BBSThemeTool method as the running operation in stall reports"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.watchdog.operation(operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def clip_text(text: str, limit: int) -> str:
+    """Shorten text to limit characters with an ellipsis"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+class StartupProfiler:
+    """Timeline of startup steps, printed with --startup-profile"""
+    
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.marks = []
+        self.pending = set()
+        self.reported = False
+        self.mark("modules imported")
+        
+    def mark(self, label: str):
+        self.marks.append(((time.perf_counter() - STARTUP_CLOCK) * 1000, label))
+        
+    def begin(self, task: str):
+        """Register background work the timeline should wait for"""
+        self.pending.add(task)
+        
+    def end(self, task: str, label: str):
+        """Finish background work and print the timeline once nothing is pending"""
+        self.mark(label)
+        self.pending.discard(task)
+        if not self.pending:
+            self.report()
+            
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        previous = 0.0
+        print("Startup timeline (ms since import):")
+        for elapsed, label in self.marks:
+            print(f"  {elapsed:8.1f}  +{elapsed - previous:7.1f}  {label}")
+            previous = elapsed
+        sys.stdout.flush()
+
 class AssetManager:
     """Manages loading and caching of image assets"""
     
@@ -108,6 +193,11 @@ class ModernButton(tk.Frame):
         if self.command:
             self.command()
             
+    def set_image(self, image):
+        """Replace the button content with an image loaded after construction"""
+        if image:
+            self.label.config(image=image, text="")
+            
     def on_enter(self, event):
         self.is_hovered = True
         self.button_frame.config(bg=self.colors["hover"])
@@ -256,14 +346,24 @@ class ModernListbox(tk.Frame):
         self.scrollbar.pack(side="right", fill="y")
         
         self.items = []
+        self.index_of = {}
+        self.groups = []
         self.selected_index = -1
         
-    def insert(self, index, text):
-        """Insert item into listbox"""
+    def add_group(self, title):
+        """Add a header that is not an item, grouping the items inserted after it"""
+        group_label = tk.Label(self.scrollable_frame, text=title, bg=ColorScheme.BG_CARD,
+                             fg=ColorScheme.TEXT_SECONDARY, font=("Arial", 9, "bold"), anchor="w", padx=6, pady=2)
+        group_label.pack(fill="x", padx=2, pady=(6, 1))
+        self.groups.append(group_label)
+        
+    def insert(self, index, text, label=None):
+        """Insert item into listbox, showing label instead of text when given"""
         item_frame = tk.Frame(self.scrollable_frame, bg=ColorScheme.BG_CARD, relief=tk.FLAT)
         item_frame.pack(fill="x", padx=2, pady=1)
         
-        item_label = tk.Label(item_frame, text=text, bg=ColorScheme.BG_CARD, fg=ColorScheme.TEXT_PRIMARY,
+        label = label or text
+        item_label = tk.Label(item_frame, text=label, bg=ColorScheme.BG_CARD, fg=ColorScheme.TEXT_PRIMARY,
                             font=("Arial", 10), anchor="w", padx=8, pady=4)
         item_label.pack(fill="x")
         
@@ -274,34 +374,100 @@ class ModernListbox(tk.Frame):
         item_frame.bind("<Button-1>", on_click)
         item_label.bind("<Button-1>", on_click)
         
-        self.items.append({"frame": item_frame, "label": item_label, "text": text})
+        self.index_of[text] = len(self.items)
+        self.items.append({"frame": item_frame, "label": item_label, "text": text, "label_text": label,
+                           "disabled": False, "on_click": on_click})
         
     def delete(self, first, last=None):
         """Delete items from listbox"""
         if last is None:
             last = first
+        if last == tk.END:
+            last = len(self.items) - 1
             
         for i in range(last, first - 1, -1):
             if 0 <= i < len(self.items):
                 self.items[i]["frame"].destroy()
                 del self.items[i]
+        self.index_of = {item["text"]: index for index, item in enumerate(self.items)}
                 
+        if not self.items:
+            for group_label in self.groups:
+                group_label.destroy()
+            self.groups = []
         self.selected_index = -1
         
+    def find(self, text):
+        """Index of the item with the given text, or -1"""
+        return self.index_of.get(text, -1)
+        
+    def set_item_disabled(self, index, disabled, note=""):
+        """Grey out an item so it cannot be selected"""
+        if not 0 <= index < len(self.items):
+            return
+            
+        item = self.items[index]
+        item["disabled"] = disabled
+        if disabled:
+            item["label"].config(text=f"⚠ {item['label_text']}  {note}".rstrip(), fg=ColorScheme.ACCENT_RED)
+            if index == self.selected_index:
+                self.paint_item(item, ColorScheme.BG_CARD)
+                self.selected_index = -1
+        else:
+            item["label"].config(text=item["label_text"], fg=ColorScheme.TEXT_PRIMARY)
+            
+    def set_item_details(self, index, details, colors=()):
+        """Show a second line with details and color swatches under an item"""
+        if not 0 <= index < len(self.items):
+            return
+            
+        item = self.items[index]
+        if "details" not in item:
+            bg = ColorScheme.ACCENT_BLUE if index == self.selected_index else ColorScheme.BG_CARD
+            details_frame = tk.Frame(item["frame"], bg=bg)
+            details_frame.pack(fill="x", padx=8, pady=(0, 4))
+            
+            swatches = []
+            for _ in colors:
+                swatch = tk.Frame(details_frame, width=12, height=12, highlightthickness=1,
+                                  highlightbackground=ColorScheme.BORDER)
+                swatch.pack(side="left", padx=(0, 4))
+                swatches.append(swatch)
+                
+            details_label = tk.Label(details_frame, bg=bg, fg=ColorScheme.TEXT_SECONDARY,
+                                   font=("Arial", 8), anchor="w")
+            details_label.pack(side="left", fill="x", padx=(4, 0))
+            
+            for widget in [details_frame, details_label] + swatches:
+                widget.bind("<Button-1>", item["on_click"])
+            item["details"] = (details_frame, details_label, swatches)
+            
+        details_frame, details_label, swatches = item["details"]
+        details_label.config(text=details)
+        for swatch, color in zip(swatches, colors):
+            swatch.config(bg=color)
+            
+    def paint_item(self, item, bg):
+        """Set the background of an item and its detail line"""
+        item["frame"].config(bg=bg)
+        item["label"].config(bg=bg)
+        if "details" in item:
+            item["details"][0].config(bg=bg)
+            item["details"][1].config(bg=bg)
+            
     def select_item(self, index):
         """Select an item"""
+        if 0 <= index < len(self.items) and self.items[index]["disabled"]:
+            return
+            
         # Deselect previous
         if 0 <= self.selected_index < len(self.items):
-            item = self.items[self.selected_index]
-            item["frame"].config(bg=ColorScheme.BG_CARD)
-            item["label"].config(bg=ColorScheme.BG_CARD)
+            self.paint_item(self.items[self.selected_index], ColorScheme.BG_CARD)
             
         # Select new
         if 0 <= index < len(self.items):
             self.selected_index = index
-            item = self.items[index]
-            item["frame"].config(bg=ColorScheme.ACCENT_BLUE)
-            item["label"].config(bg=ColorScheme.ACCENT_BLUE)
+            self.paint_item(self.items[index], ColorScheme.ACCENT_BLUE)
             
     def get(self, index):
         """Get item text"""
@@ -311,26 +477,317 @@ class ModernListbox(tk.Frame):
             return self.items[index]["text"]
         return ""
 
+class ModernGallery(tk.Frame):
+    """Thumbnail grid of themes drawn on a single canvas.
+    
+    Only the cells in view exist on the canvas. Thumbnails of visible cells
+    are decoded on worker threads and replace the placeholders as they
+    arrive; at most GALLERY_MAX_THUMBNAILS decoded images are kept.
+    Offers the same item methods as ModernListbox. With multiselect, clicks
+    toggle items in and out of the selection returned by checked_items().
+    """
+    
+    def __init__(self, parent, decode_thumbnail, multiselect=False, **kwargs):
+        super().__init__(parent, bg=ColorScheme.BG_PRIMARY, **kwargs)
+        
+        self.canvas = tk.Canvas(self, bg=ColorScheme.BG_CARD, highlightthickness=0, height=200,
+                                yscrollincrement=GALLERY_CELL[1] // 4)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        self.items = []
+        self.index_of = {}
+        self.selected_index = -1
+        self.multiselect = multiselect
+        self.checked = set()
+        self.columns = 0
+        self.drawn = set()
+        self.photos = OrderedDict()
+        self.failed = set()
+        self.render_pending = False
+        self.loader = ThumbnailLoader(lambda name: decode_thumbnail(name, GALLERY_THUMB), self.on_thumbnail)
+        
+        self.canvas.bind("<Configure>", lambda e: self.schedule_render())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll(1))
+        self.bind("<Destroy>", lambda e: self.loader.close() if e.widget is self else None)
+        
+    def add_group(self, title):
+        """Groups are not drawn, cells show the full theme name including its category"""
+        
+    def insert(self, index, text, label=None):
+        """Append an item"""
+        self.index_of[text] = len(self.items)
+        self.items.append({"text": text, "label_text": text, "disabled": False, "note": "",
+                           "details": "", "colors": ()})
+        self.schedule_render()
+        
+    def delete(self, first, last=None):
+        """Delete items"""
+        if last is None:
+            last = first
+        if last == tk.END:
+            last = len(self.items) - 1
+            
+        del self.items[first:last + 1]
+        self.index_of = {item["text"]: index for index, item in enumerate(self.items)}
+        self.canvas.delete("cell")
+        self.drawn.clear()
+        self.selected_index = -1
+        self.checked.clear()
+        # The list is refreshed, broken backgrounds may have been fixed since
+        self.failed.clear()
+        self.schedule_render()
+        
+    def find(self, text):
+        """Index of the item with the given text, or -1"""
+        return self.index_of.get(text, -1)
+        
+    def set_item_disabled(self, index, disabled, note=""):
+        """Mark an item as broken so it cannot be selected"""
+        if not 0 <= index < len(self.items):
+            return
+        if self.items[index]["disabled"] and not disabled:
+            # Validation only changes its verdict when the theme's files changed, try the thumbnail again
+            self.failed.discard(self.items[index]["text"])
+            self.schedule_render()
+        self.items[index]["disabled"] = disabled
+        self.items[index]["note"] = note
+        if disabled and index == self.selected_index:
+            self.selected_index = -1
+        if disabled:
+            self.checked.discard(index)
+        self.redraw_cell(index)
+        
+    def set_item_details(self, index, details, colors=()):
+        """Show details and color swatches under a thumbnail"""
+        if not 0 <= index < len(self.items):
+            return
+        self.items[index]["details"] = details
+        self.items[index]["colors"] = tuple(colors)
+        self.redraw_cell(index)
+        
+    def select_item(self, index):
+        """Select an item"""
+        if not 0 <= index < len(self.items) or self.items[index]["disabled"]:
+            return
+        if self.multiselect:
+            self.checked ^= {index}
+        previous = self.selected_index
+        self.selected_index = index
+        self.redraw_cell(previous)
+        self.redraw_cell(index)
+        
+    def checked_items(self):
+        """Texts of the items picked in a multiselect gallery, in list order"""
+        return [self.items[index]["text"] for index in sorted(self.checked)]
+        
+    def get(self, index):
+        """Get item text"""
+        if index == tk.ACTIVE:
+            index = self.selected_index
+        if 0 <= index < len(self.items):
+            return self.items[index]["text"]
+        return ""
+        
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_render()
+        
+    def scroll(self, steps):
+        self.canvas.yview_scroll(steps, "units")
+        self.schedule_render()
+        
+    def on_wheel(self, event):
+        self.scroll(-1 if event.delta > 0 else 1)
+        
+    def on_click(self, event):
+        column = int(self.canvas.canvasx(event.x) // GALLERY_CELL[0])
+        row = int(self.canvas.canvasy(event.y) // GALLERY_CELL[1])
+        if column < self.columns:
+            self.select_item(row * self.columns + column)
+            
+    def schedule_render(self):
+        """Coalesce layout and scroll changes into one render per idle pass"""
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self.render)
+            
+    def render(self):
+        """Draw the cells in view, drop the others and request their thumbnails"""
+        self.render_pending = False
+        if not self.winfo_exists():
+            return
+            
+        cell_width, cell_height = GALLERY_CELL
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        columns = max(1, width // cell_width)
+        rows = -(-len(self.items) // columns)
+        self.canvas.configure(scrollregion=(0, 0, columns * cell_width, max(rows * cell_height, height)))
+        if columns != self.columns:
+            self.columns = columns
+            self.canvas.delete("cell")
+            self.drawn.clear()
+            
+        top = self.canvas.canvasy(0)
+        first = int(top // cell_height) * columns
+        last = min(len(self.items), (int((top + height) // cell_height) + 1) * columns)
+        visible = range(first, last)
+        
+        for index in list(self.drawn):
+            if index not in visible:
+                self.canvas.delete(f"cell{index}")
+                self.drawn.discard(index)
+        for index in visible:
+            if index not in self.drawn:
+                self.draw_cell(index)
+                
+        # Visible cells first, then one screen ahead so scrolling down finds them ready
+        ahead = range(last, min(len(self.items), last + (last - first)))
+        wanted = {}
+        for priority, index in enumerate(list(visible) + list(ahead)):
+            name = self.items[index]["text"]
+            if name not in self.photos and name not in self.failed:
+                wanted[name] = priority
+        self.loader.update(wanted)
+        
+    def draw_cell(self, index):
+        cell_width, cell_height = GALLERY_CELL
+        item = self.items[index]
+        x = (index % self.columns) * cell_width
+        y = (index // self.columns) * cell_height
+        tags = ("cell", f"cell{index}")
+        
+        selected = index in self.checked if self.multiselect else index == self.selected_index
+        if selected:
+            outline, border = ColorScheme.ACCENT_BLUE, 2
+        else:
+            outline, border = (ColorScheme.ACCENT_RED if item["disabled"] else ColorScheme.BORDER), 1
+        self.canvas.create_rectangle(x + 4, y + 4, x + cell_width - 4, y + cell_height - 4,
+                                     fill=ColorScheme.BG_SECONDARY, outline=outline, width=border, tags=tags)
+        
+        thumb_x, thumb_y = x + (cell_width - GALLERY_THUMB[0]) // 2, y + 10
+        photo = self.photos.get(item["text"])
+        if photo is not None:
+            self.photos.move_to_end(item["text"])
+            self.canvas.create_image(thumb_x, thumb_y, image=photo, anchor="nw", tags=tags)
+        else:
+            placeholder = item["colors"][1] if len(item["colors"]) > 1 else ColorScheme.BG_CARD
+            self.canvas.create_rectangle(thumb_x, thumb_y, thumb_x + GALLERY_THUMB[0], thumb_y + GALLERY_THUMB[1],
+                                         fill=placeholder, outline="", tags=tags)
+            status = "No preview" if item["text"] in self.failed else "Loading..."
+            self.canvas.create_text(thumb_x + GALLERY_THUMB[0] // 2, thumb_y + GALLERY_THUMB[1] // 2, text=status,
+                                    fill=ColorScheme.TEXT_SECONDARY, font=("Arial", 8), tags=tags)
+            
+        name = f"⚠ {item['label_text']}" if item["disabled"] else item["label_text"]
+        if self.multiselect and selected:
+            name = f"✓ {name}"
+        self.canvas.create_text(thumb_x, y + GALLERY_THUMB[1] + 14, text=clip_text(name, 26), anchor="nw",
+                                fill=ColorScheme.ACCENT_RED if item["disabled"] else ColorScheme.TEXT_PRIMARY,
+                                font=("Arial", 9, "bold"), tags=tags)
+        
+        detail_x = thumb_x
+        for color in item["colors"]:
+            self.canvas.create_rectangle(detail_x, y + GALLERY_THUMB[1] + 32, detail_x + 10, y + GALLERY_THUMB[1] + 42,
+                                         fill=color, outline=ColorScheme.BORDER, tags=tags)
+            detail_x += 14
+        detail = item["note"] if item["disabled"] else item["details"].split("  ·  ")[0]
+        self.canvas.create_text(detail_x + 2, y + GALLERY_THUMB[1] + 30, text=clip_text(detail, 28), anchor="nw",
+                                fill=ColorScheme.TEXT_SECONDARY, font=("Arial", 8), tags=tags)
+        self.drawn.add(index)
+        
+    def redraw_cell(self, index):
+        if index in self.drawn:
+            self.canvas.delete(f"cell{index}")
+            self.draw_cell(index)
+            
+    def on_thumbnail(self, name, image):
+        """Worker thread callback, hands the image over to the main thread"""
+        try:
+            self.after(0, lambda: self.show_thumbnail(name, image))
+        except (RuntimeError, tk.TclError):
+            pass  # Window already closed
+            
+    def show_thumbnail(self, name, image):
+        """Replace a placeholder with its decoded thumbnail"""
+        if not self.winfo_exists():
+            return
+        if image is None:
+            self.failed.add(name)
+        else:
+            self.photos[name] = ImageTk.PhotoImage(image)
+            
+            # Forget the least recently drawn thumbnails that are off screen
+            visible = {self.items[index]["text"] for index in self.drawn}
+            for old_name in list(self.photos):
+                if len(self.photos) <= GALLERY_MAX_THUMBNAILS:
+                    break
+                if old_name not in visible:
+                    del self.photos[old_name]
+                    
+        index = self.index_of.get(name, -1)
+        self.redraw_cell(index)
+
 class BBSThemeTool:
     """Main application class with modern UI and optimized code"""
     
-    def __init__(self):
+    def __init__(self, startup_profile: bool = False, stall_threshold: int = 250,
+                 stall_report: str = STALL_REPORT_FILE, io_bandwidth: int = DEFAULT_BANDWIDTH):
+        self.profiler = StartupProfiler(startup_profile)
         self.root = tk.Tk()
-        self.setup_window()
+        self.profiler.mark("Tk root created")
+        self.watchdog = StallWatchdog(self.root, stall_threshold)
+        self.stall_report = stall_report
+        self.io = IOScheduler(io_bandwidth)
         
         # Initialize managers
         self.asset_manager = AssetManager()
+        self.palette_analyzer = None
+        self.similarity_index = None
+        self.theme_validator = None
+        self.theme_resolver = None
+        self.invalid_themes = {}
+        self.running_validator = None
+        self.theme_metadata = {}
+        self.metadata_path = None
+        self.metadata_generation = 0
+        self.scaled_backgrounds = ScaledBackgroundCache()
+        self.png_optimizer = PngOptimizer()
         
         # State variables
+        self.repository_url = None
         self.import_mode = tk.BooleanVar(value=False)
         self.export_mode = tk.BooleanVar(value=False)
         self.export_type = tk.StringVar(value="zip")
+        self.downscale_background = tk.BooleanVar(value=False)
+        self.downscale_size = tk.StringVar(value="{}x{}".format(*TARGET_SIZES[1]))
+        self.optimize_export = tk.BooleanVar(value=False)
+        self.gallery_view = tk.BooleanVar(value=False)
+        self.all_themes = []
+        self.listed_themes = []
+        self.listed_grouped = True
         
         # UI components
         self.widgets = {}
         
+        self.setup_window()
         self.setup_ui()
-        self.setup_styles()
+        self.profiler.mark("widgets built")
+        
+        # Everything not needed for the first frame runs after the window is shown
+        self.deferred_steps = [
+            (self.load_icons, "icons decoded"),
+            (self.setup_styles, "ttk styles configured"),
+            (self.restore_last_config, "last config path restored"),
+        ]
+        self.profiler.begin("deferred")
+        self.root.bind("<Map>", self.on_first_map)
+        self.watchdog.start()
         
         logging.info("Modern BBS Theme Tool initialized")
         
@@ -341,10 +798,82 @@ class BBSThemeTool:
         self.root.configure(bg=ColorScheme.BG_PRIMARY)
         self.root.resizable(True, True)
         
-        # Load custom icon
+    def on_first_map(self, event):
+        """Start the deferred startup steps once the main window is on screen"""
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        self.profiler.mark("window mapped")
+        self.root.after(1, self.run_deferred_step)
+        
+    def run_deferred_step(self):
+        """Run one deferred startup step per idle callback so input stays responsive"""
+        if not self.deferred_steps:
+            self.profiler.end("deferred", "deferred steps finished")
+            return
+            
+        step, label = self.deferred_steps.pop(0)
+        try:
+            step()
+        except Exception as e:
+            logging.error(f"Startup step failed: {e}")
+        self.profiler.mark(label)
+        self.root.after_idle(self.run_deferred_step)
+        
+    def load_icons(self):
+        """Decode the window and button icons"""
         icon = self.asset_manager.load_image("myicon.png")
         if icon:
             self.root.iconphoto(True, icon)
+        self.widgets["reload_button"].set_image(self.asset_manager.load_image("reload.png", (24, 24)))
+        
+    def restore_last_config(self):
+        """Fill in the last used config path and warm the theme catalog in the background"""
+        try:
+            with open(SETTINGS_FILE, "r") as file:
+                config_path = json.load(file).get("last_config_path")
+        except (OSError, ValueError):
+            return
+            
+        if not config_path or not os.path.exists(os.path.join(config_path, "settings", "bbs.json")):
+            return
+        if self.widgets["path_entry"].get():
+            return
+            
+        self.widgets["path_entry"].delete(0, tk.END)
+        self.widgets["path_entry"].insert(0, config_path)
+        
+        theme_path = os.path.join(config_path, "theme")
+        self.profiler.begin("catalog")
+        
+        def worker():
+            try:
+                themes = list_themes(theme_path, self.io, PREFETCH)
+            except OSError as e:
+                logging.warning(f"Could not list themes: {e}")
+                themes = []
+            self.root.after(0, lambda: self.prefetch_metadata(theme_path, themes))
+            
+        threading.Thread(target=worker, daemon=True).start()
+        
+    def prefetch_metadata(self, theme_path, themes):
+        """Describe themes before the theme list is opened"""
+        if self.metadata_path is not None:
+            # The list was opened meanwhile and loads its own metadata
+            self.profiler.end("catalog", "theme catalog skipped")
+            return
+        self.metadata_path = theme_path
+        self.start_metadata_loading(themes, on_complete=lambda: self.profiler.end("catalog", "theme catalog loaded"))
+        
+    def save_last_config(self, config_path):
+        """Remember the config path for the next session"""
+        try:
+            temp_path = SETTINGS_FILE + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump({"last_config_path": config_path}, file)
+            os.replace(temp_path, SETTINGS_FILE)
+        except OSError as e:
+            logging.warning(f"Could not save settings: {e}")
             
     def setup_styles(self):
         """Configure ttk styles"""
@@ -403,10 +932,10 @@ class BBSThemeTool:
         browse_btn = ModernButton(path_frame, text="Browse", command=self.select_config_path, style="secondary")
         browse_btn.pack(side="right", ipadx=10)
         
-        # Reload button
-        reload_icon = self.asset_manager.load_image("reload.png", (24, 24))
-        reload_btn = ModernButton(path_frame, image=reload_icon, command=self.update_ui, style="secondary")
+        # Reload button, its icon is decoded after the window is shown
+        reload_btn = ModernButton(path_frame, text="\u21bb", command=self.reload_themes, style="secondary")
         reload_btn.pack(side="right", padx=(0, 10))
+        self.widgets["reload_button"] = reload_btn
         
         return section_frame
         
@@ -465,24 +994,78 @@ class BBSThemeTool:
                               font=("Arial", 11, "bold"))
         search_label.pack(anchor="w", pady=(0, 5))
         
-        self.widgets["search_entry"] = ModernEntry(search_frame, placeholder="Type to search themes...")
-        self.widgets["search_entry"].pack(fill="x")
+        search_row = tk.Frame(search_frame, bg=ColorScheme.BG_PRIMARY)
+        search_row.pack(fill="x")
+        
+        self.widgets["search_entry"] = ModernEntry(search_row, placeholder="Type to search themes...")
+        self.widgets["search_entry"].pack(side="left", fill="x", expand=True)
+        
+        if NUMPY_AVAILABLE:
+            similar_btn = ModernButton(search_row, text="More Like This", command=self.show_similar_themes, style="secondary")
+            similar_btn.pack(side="right", padx=(10, 0))
         self.widgets["search_entry"].entry.bind("<KeyRelease>", self.search_themes)
         
         # Theme list section
         list_frame = tk.Frame(self.content_frame, bg=ColorScheme.BG_PRIMARY)
         list_frame.pack(fill="both", expand=True, pady=(15, 0))
         
-        list_label = tk.Label(list_frame, text="Available Themes", 
+        list_header = tk.Frame(list_frame, bg=ColorScheme.BG_PRIMARY)
+        list_header.pack(fill="x", pady=(0, 5))
+        
+        list_label = tk.Label(list_header, text="Available Themes", 
                             bg=ColorScheme.BG_PRIMARY, fg=ColorScheme.TEXT_PRIMARY,
                             font=("Arial", 11, "bold"))
-        list_label.pack(anchor="w", pady=(0, 5))
+        list_label.pack(side="left")
         
-        self.widgets["theme_listbox"] = ModernListbox(list_frame)
-        self.widgets["theme_listbox"].pack(fill="both", expand=True)
+        self.widgets["gallery_checkbox"] = ModernCheckbox(list_header, text="Gallery view",
+                                                        variable=self.gallery_view, command=self.toggle_gallery_view)
+        self.widgets["gallery_checkbox"].pack(side="right")
+        
+        self.create_theme_view(list_frame)
+        
+        # Import options
+        options_frame = tk.Frame(self.content_frame, bg=ColorScheme.BG_PRIMARY)
+        options_frame.pack(fill="x", pady=(10, 0))
+        
+        self.widgets["downscale_checkbox"] = ModernCheckbox(options_frame, text="Downscale background to",
+                                                          variable=self.downscale_background)
+        self.widgets["downscale_checkbox"].pack(side="left")
+        
+        size_menu = tk.OptionMenu(options_frame, self.downscale_size,
+                                  *["{}x{}".format(*size) for size in TARGET_SIZES])
+        size_menu.config(bg=ColorScheme.BG_CARD, fg=ColorScheme.TEXT_PRIMARY, activebackground=ColorScheme.HOVER,
+                         activeforeground=ColorScheme.TEXT_PRIMARY, highlightthickness=0, relief=tk.FLAT,
+                         font=("Arial", 9))
+        size_menu.pack(side="left", padx=(8, 0))
         
         self.load_themes()
         
+    def create_theme_view(self, parent):
+        """Create the theme list or the thumbnail gallery, depending on the view setting"""
+        if self.gallery_view.get():
+            theme_path = os.path.join(self.widgets["path_entry"].get(), "theme")
+            view = ModernGallery(parent, lambda name, size: self.io.run(PREFETCH, load_theme_thumbnail,
+                                                                        theme_path, name, size))
+        else:
+            view = ModernListbox(parent)
+        view.pack(fill="both", expand=True)
+        self.widgets["theme_listbox"] = view
+        
+    def toggle_gallery_view(self):
+        """Switch between the theme list and the gallery, keeping the listed themes"""
+        view = self.widgets.get("theme_listbox")
+        if view is None or not view.winfo_exists():
+            return
+        selected_theme = view.get(tk.ACTIVE)
+        parent = view.master
+        view.destroy()
+        
+        self.create_theme_view(parent)
+        self.populate_theme_list(self.listed_themes, self.listed_grouped)
+        index = self.widgets["theme_listbox"].find(selected_theme)
+        if index >= 0:
+            self.widgets["theme_listbox"].select_item(index)
+            
     def create_export_content(self):
         """Create export mode content"""
         self.clear_content()
@@ -530,6 +1113,14 @@ class BBSThemeTool:
                                                        command=lambda: self.set_export_type("folder"))
         self.widgets["folder_checkbox"].pack()
         
+        # Export options
+        optimize_frame = tk.Frame(self.content_frame, bg=ColorScheme.BG_PRIMARY)
+        optimize_frame.pack(fill="x", pady=(15, 0))
+        
+        self.widgets["optimize_checkbox"] = ModernCheckbox(optimize_frame, text="Optimize PNGs (lossless, smaller pack)",
+                                                         variable=self.optimize_export)
+        self.widgets["optimize_checkbox"].pack(side="left")
+        
     def create_action_section(self, parent):
         """Create action buttons section"""
         action_frame = tk.Frame(parent, bg=ColorScheme.BG_SECONDARY, height=70)
@@ -539,6 +1130,10 @@ class BBSThemeTool:
         button_frame = tk.Frame(action_frame, bg=ColorScheme.BG_SECONDARY)
         button_frame.pack(side="right", padx=20, pady=15)
         
+        # Repository button
+        repository_btn = ModernButton(button_frame, text="Repository", command=self.sync_repository, style="secondary")
+        repository_btn.pack(side="left", padx=(0, 10), ipadx=15)
+        
         # Preview button
         preview_btn = ModernButton(button_frame, text="Preview", command=self.preview_theme, style="secondary")
         preview_btn.pack(side="left", padx=(0, 10), ipadx=15)
@@ -563,6 +1158,7 @@ class BBSThemeTool:
         for widget in self.content_frame.winfo_children():
             widget.destroy()
             
+    @watched("switch mode")
     def on_mode_change(self):
         """Handle mode selection change"""
         config_path = self.widgets["path_entry"].get()
@@ -620,12 +1216,19 @@ class BBSThemeTool:
             
         self.widgets["path_entry"].delete(0, tk.END)
         self.widgets["path_entry"].insert(0, path)
+        self.save_last_config(path)
         self.update_ui()
         
     def update_ui(self):
         """Update UI state"""
         self.on_mode_change()
         
+    def reload_themes(self):
+        """Re-read the theme directory, dropping cached metadata"""
+        self.metadata_path = None
+        self.update_ui()
+        
+    @watched("load themes")
     def load_themes(self):
         """Load available themes"""
         config_path = self.widgets["path_entry"].get()
@@ -637,14 +1240,114 @@ class BBSThemeTool:
             logging.warning(f"Theme directory not found: {theme_path}")
             return
             
-        themes = [f for f in os.listdir(theme_path) 
-                 if os.path.isdir(os.path.join(theme_path, f)) or f.endswith(".zip")]
-        
         if "theme_listbox" in self.widgets:
-            self.widgets["theme_listbox"].delete(0, tk.END)
-            for theme in sorted(themes):
-                self.widgets["theme_listbox"].insert(tk.END, theme)
+            if theme_path != self.metadata_path:
+                self.metadata_path = theme_path
+                self.theme_metadata = {}
+            self.all_themes = list_themes(theme_path, self.io, INTERACTIVE)
+            self.populate_theme_list(self.all_themes)
+            self.start_validation(theme_path)
+                
+    @watched("fill theme list")
+    def populate_theme_list(self, themes, grouped=True):
+        """Fill the theme list, flagging themes known to be invalid.
+        
+        With grouped set, themes in category folders are listed under a header
+        per category, which expects themes ordered by category as listed.
+        """
+        self.listed_themes = list(themes)
+        self.listed_grouped = grouped
+        listbox = self.widgets["theme_listbox"]
+        listbox.delete(0, tk.END)
+        category = ""
+        for index, theme in enumerate(themes):
+            label = theme
+            if grouped:
+                if theme_category(theme) != category:
+                    category = theme_category(theme)
+                    listbox.add_group(category.replace("/", " / ") if category else "Uncategorized")
+                if category:
+                    label = theme[len(category) + 1:]
+            listbox.insert(tk.END, theme, label)
+            errors = self.invalid_themes.get(theme)
+            if errors:
+                listbox.set_item_disabled(index, True, errors[0])
+            if theme in self.theme_metadata:
+                self.show_theme_metadata(index, self.theme_metadata[theme])
+                
+        self.start_metadata_loading([t for t in themes if t not in self.theme_metadata])
+        
+    def start_metadata_loading(self, themes, on_complete=None):
+        """Describe themes in background batches and fill in the list as they arrive"""
+        self.metadata_generation += 1
+        generation = self.metadata_generation
+        self.io.cancel("metadata")
+        theme_path = os.path.join(self.widgets["path_entry"].get(), "theme")
+        if not themes:
+            if on_complete:
+                on_complete()
+            return
+            
+        def describe(theme):
+            try:
+                # Layered themes show the colors and assets they end up with
+                return theme, describe_theme(theme_path, theme, self.resolver_for(theme_path))
+            except Exception as e:
+                logging.debug(f"No metadata for {theme}: {e}")
+                return theme, None
+                
+        def load():
+            for start in range(0, len(themes), METADATA_BATCH):
+                # A newer list replaced this one, stop working for it
+                if generation != self.metadata_generation:
+                    return
+                futures = [self.io.submit(PREFETCH, describe, theme, tag="metadata")
+                           for theme in themes[start:start + METADATA_BATCH]]
+                try:
+                    batch = [future.result() for future in futures]
+                except CancelledError:
+                    return
+                self.root.after(0, lambda batch=batch: self.on_metadata_batch(generation, batch))
+                
+        def worker():
+            try:
+                load()
+            finally:
+                # Also when superseded, the startup profile waits for this
+                if on_complete:
+                    self.root.after(0, on_complete)
+                
+        threading.Thread(target=worker, daemon=True).start()
+        
+    @watched("show theme metadata")
+    def on_metadata_batch(self, generation, batch):
+        """Store a batch of theme metadata and show it on the main thread"""
+        for theme, metadata in batch:
+            if metadata is not None:
+                self.theme_metadata[theme] = metadata
+                
+        if generation != self.metadata_generation:
+            return
+        if "theme_listbox" not in self.widgets or not self.widgets["theme_listbox"].winfo_exists():
+            return
+            
+        listbox = self.widgets["theme_listbox"]
+        for theme, metadata in batch:
+            if metadata is not None:
+                self.show_theme_metadata(listbox.find(theme), metadata)
                 
+    def show_theme_metadata(self, index, metadata):
+        """Render the detail line of a theme list entry"""
+        parts = []
+        if metadata.get("resolution"):
+            width, height = metadata["resolution"]
+            parts.append(f"{width}x{height}")
+        parts.append(format_size(metadata["size"]))
+        parts.extend(f"{name.split('.')[0]} {format_size(size)}" for name, size in metadata["assets"].items())
+        colors = [f"#{metadata[key] & 0xFFFFFF:06x}" for key in ["primary_color", "background_color"]]
+        self.widgets["theme_listbox"].set_item_details(index, "  ·  ".join(parts), colors)
+                
+    @watched("search themes")
     def search_themes(self, event=None):
         """Filter themes based on search"""
         if "search_entry" not in self.widgets or "theme_listbox" not in self.widgets:
@@ -660,118 +1363,315 @@ class BBSThemeTool:
         if not os.path.exists(theme_path):
             return
             
-        all_themes = [f for f in os.listdir(theme_path) 
-                     if os.path.isdir(os.path.join(theme_path, f)) or f.endswith(".zip")]
+        # Filter the last scan instead of walking the theme directory on every key press
+        filtered_themes = [theme for theme in self.all_themes if search_term in theme.lower()]
+        self.populate_theme_list(filtered_themes)
+        
+    def start_validation(self, theme_path):
+        """Validate the theme directory in the background and flag broken themes"""
+        from theme_validator import ThemeValidator
+        
+        if self.theme_validator is None or self.theme_validator.theme_path != theme_path:
+            if self.theme_validator is not None:
+                self.theme_validator.cancel(self.io)
+            self.theme_validator = ThemeValidator(theme_path)
+            self.invalid_themes = {}
+        if self.running_validator is not None:
+            # on_validation_finished starts the new validator once the old run stops
+            return
+        validator = self.running_validator = self.theme_validator
         
-        filtered_themes = [theme for theme in all_themes if search_term in theme.lower()]
+        def on_result(theme_name, errors):
+            self.root.after(0, lambda: self.on_theme_validated(validator, theme_name, errors))
+            
+        def worker():
+            try:
+                validator.validate(on_result=on_result, scheduler=self.io)
+            except Exception as e:
+                logging.error(f"Validation error: {e}")
+            finally:
+                self.root.after(0, lambda: self.on_validation_finished(validator))
+                
+        threading.Thread(target=worker, daemon=True).start()
         
-        self.widgets["theme_listbox"].delete(0, tk.END)
-        for theme in sorted(filtered_themes):
-            self.widgets["theme_listbox"].insert(tk.END, theme)
+    def on_validation_finished(self, validator):
+        """Validate the current directory when it changed while another one was validated"""
+        self.running_validator = None
+        if validator is not self.theme_validator:
+            self.start_validation(self.theme_validator.theme_path)
             
-    def preview_theme(self):
-        """Preview selected theme with modern UI"""
+    def on_theme_validated(self, validator, theme_name, errors):
+        """Apply a validation verdict on the main thread"""
+        if validator is not self.theme_validator:
+            return
+            
+        if errors:
+            self.invalid_themes[theme_name] = errors
+        else:
+            self.invalid_themes.pop(theme_name, None)
+            
+        if "theme_listbox" in self.widgets and self.widgets["theme_listbox"].winfo_exists():
+            listbox = self.widgets["theme_listbox"]
+            listbox.set_item_disabled(listbox.find(theme_name), bool(errors), errors[0] if errors else "")
+            
+    def sync_repository(self):
+        """Browse a theme repository server and install the themes picked from its catalog"""
         config_path = self.widgets["path_entry"].get()
         if not config_path:
             messagebox.showerror("Error", "Please select a config path.")
             return
             
-        try:
-            if self.import_mode.get():
-                theme_data = self.get_import_theme_data()
-            elif self.export_mode.get():
-                theme_data = self.get_export_theme_data()
-            else:
-                messagebox.showerror("Error", "Please select Import or Export mode.")
-                return
+        url = simpledialog.askstring("Theme Repository", "Repository URL:",
+                                     initialvalue=self.repository_url or "http://localhost:8765",
+                                     parent=self.root)
+        if not url:
+            return
+        self.repository_url = url
+        theme_path = os.path.join(config_path, "theme")
+        
+        from theme_repository import ThemeRepositoryClient
+        
+        def worker():
+            client = ThemeRepositoryClient(url)
+            try:
+                themes = client.list_themes()
+                conflicts = {theme["name"]: client.local_conflict(theme, theme_path) for theme in themes}
+                self.root.after(0, lambda: self.show_repository_window(client, themes, conflicts, theme_path))
+            except Exception as e:
+                logging.error(f"Repository error: {e}")
+                client.close()
+                self.root.after(0, lambda e=e: messagebox.showerror("Error", f"Cannot read the repository: {e}"))
                 
-            if not theme_data:
-                return
+        threading.Thread(target=worker, daemon=True).start()
+        
+    def show_repository_window(self, client, themes, conflicts, theme_path):
+        """Show a repository catalog with its served thumbnails and install the picked themes"""
+        by_name = {theme["name"]: theme for theme in themes}
+        
+        window = tk.Toplevel(self.root)
+        window.title("Theme Repository")
+        window.geometry("860x600")
+        window.configure(bg=ColorScheme.BG_PRIMARY)
+        
+        # Header
+        header_frame = tk.Frame(window, bg=ColorScheme.BG_SECONDARY, height=50)
+        header_frame.pack(fill="x")
+        header_frame.pack_propagate(False)
+        
+        title_label = tk.Label(header_frame, text=f"{client.base_url}  ·  {len(themes)} themes", 
+                             bg=ColorScheme.BG_SECONDARY, fg=ColorScheme.TEXT_PRIMARY,
+                             font=("Arial", 12, "bold"))
+        title_label.pack(pady=15)
+        
+        # Click thumbnails to pick them, themes clashing with a local one cannot be picked
+        gallery = ModernGallery(window, lambda name, size: load_preview(client.thumbnail(by_name[name]), size),
+                                multiselect=True)
+        gallery.pack(fill="both", expand=True, padx=20, pady=(20, 10))
+        for theme in themes:
+            gallery.insert(tk.END, theme["name"])
+            index = gallery.find(theme["name"])
+            colors = [f"#{theme[key] & 0xFFFFFF:06x}" for key in ["primary_color", "background_color"]]
+            gallery.set_item_details(index, format_size(theme["size"]), colors)
+            if conflicts.get(theme["name"]):
+                gallery.set_item_disabled(index, True, f"{conflicts[theme['name']]} exists")
                 
-            self.show_preview_window(theme_data)
+        button_frame = tk.Frame(window, bg=ColorScheme.BG_PRIMARY)
+        button_frame.pack(fill="x", padx=20, pady=(0, 20))
+        
+        def close():
+            window.destroy()
+            client.close()
             
-        except Exception as e:
-            logging.error(f"Error in preview: {e}")
-            messagebox.showerror("Error", f"Preview failed: {e}")
+        def install():
+            picked = [by_name[name] for name in gallery.checked_items()]
+            if not picked:
+                messagebox.showerror("Error", "Please select the themes to install.", parent=window)
+                return
+            window.destroy()
             
-    def get_import_theme_data(self):
-        """Get theme data for import preview"""
-        if "theme_listbox" not in self.widgets:
-            messagebox.showerror("Error", "No themes loaded.")
-            return None
+            def worker():
+                try:
+                    changed = client.download_themes(picked, theme_path)
+                    self.root.after(0, lambda: self.on_repository_synced(changed, None))
+                except Exception as e:
+                    logging.error(f"Repository sync error: {e}")
+                    self.root.after(0, lambda e=e: self.on_repository_synced(None, e))
+                finally:
+                    client.close()
+                    
+            threading.Thread(target=worker, daemon=True).start()
+            
+        install_btn = ModernButton(button_frame, text="Install Selected", command=install, style="primary")
+        install_btn.pack(side="right", ipadx=15)
+        close_btn = ModernButton(button_frame, text="Close", command=close, style="secondary")
+        close_btn.pack(side="right", padx=(0, 10), ipadx=15)
+        window.protocol("WM_DELETE_WINDOW", close)
+        
+    def on_repository_synced(self, changed, error):
+        """Report the result of a repository sync on the main thread"""
+        if error is not None:
+            messagebox.showerror("Error", f"Repository sync failed: {error}")
+            return
             
+        self.metadata_path = None
+        self.load_themes()
+        messagebox.showinfo("Success", f"{len(changed)} theme(s) installed or updated.")
+        
+    def show_similar_themes(self):
+        """Replace the theme list with the themes that look most like the selected one"""
         selected_theme = self.widgets["theme_listbox"].get(tk.ACTIVE)
         if not selected_theme:
-            messagebox.showerror("Error", "Please select a theme to preview.")
-            return None
+            messagebox.showerror("Error", "Please select a theme first.")
+            return
             
-        config_path = self.widgets["path_entry"].get()
-        theme_path = os.path.join(config_path, "theme")
+        theme_path = os.path.join(self.widgets["path_entry"].get(), "theme")
         
-        # Handle ZIP files
-        if selected_theme.endswith(".zip"):
-            temp_dir = os.path.join(theme_path, "temp_preview")
-            os.makedirs(temp_dir, exist_ok=True)
-            
+        from theme_similarity import SimilarityIndex
+        
+        def worker():
             try:
-                shutil.unpack_archive(os.path.join(theme_path, selected_theme), temp_dir)
-                config_files = glob.glob(os.path.join(temp_dir, '**', 'config.txt'), recursive=True)
-                if not config_files:
-                    messagebox.showerror("Error", "config.txt not found in ZIP file!")
-                    return None
-                    
-                config_file = config_files[0]
-                theme_dir = os.path.dirname(config_file)
-            finally:
-                # Cleanup will happen in calling function
-                pass
+                if self.similarity_index is None or self.similarity_index.theme_path != theme_path:
+                    self.similarity_index = SimilarityIndex(theme_path)
+                self.similarity_index.update()
+                matches = self.similarity_index.similar(selected_theme, count=20)
+                self.root.after(0, lambda: self.on_similar_themes(selected_theme, matches))
+            except Exception as e:
+                logging.error(f"Similarity search error: {e}")
+                self.root.after(0, lambda e=e: messagebox.showerror("Error", f"Similarity search failed: {e}"))
+                
+        threading.Thread(target=worker, daemon=True).start()
+        
+    def on_similar_themes(self, selected_theme, matches):
+        """Show similarity results on the main thread"""
+        if "theme_listbox" not in self.widgets:
+            return
+            
+        self.populate_theme_list([selected_theme] + [theme for _, theme in matches], grouped=False)
+        self.widgets["theme_listbox"].select_item(0)
+        
+    @watched("preview theme")
+    def preview_theme(self):
+        """Load the selected theme in the interactive I/O lane and preview it when ready"""
+        config_path = self.widgets["path_entry"].get()
+        if not config_path:
+            messagebox.showerror("Error", "Please select a config path.")
+            return
+            
+        if self.import_mode.get():
+            if "theme_listbox" not in self.widgets:
+                messagebox.showerror("Error", "No themes loaded.")
+                return
+            selected_theme = self.widgets["theme_listbox"].get(tk.ACTIVE)
+            if not selected_theme:
+                messagebox.showerror("Error", "Please select a theme to preview.")
+                return
+            load = functools.partial(self.get_import_theme_data, os.path.join(config_path, "theme"), selected_theme)
+        elif self.export_mode.get():
+            load = functools.partial(self.get_export_theme_data, config_path)
         else:
-            config_file = os.path.join(theme_path, selected_theme, "config.txt")
-            theme_dir = os.path.join(theme_path, selected_theme)
+            messagebox.showerror("Error", "Please select Import or Export mode.")
+            return
             
-        if not os.path.exists(config_file):
-            messagebox.showerror("Error", "config.txt not found!")
-            return None
+        # A newer preview request replaces one that is still loading
+        self.io.cancel("preview")
+        future = self.io.submit(INTERACTIVE, self.load_preview_data, load, tag="preview")
+        future.add_done_callback(lambda future: self.root.after(0, lambda: self.on_preview_loaded(future)))
+        
+    @watched("show preview")
+    def on_preview_loaded(self, future):
+        """Show a loaded preview on the main thread"""
+        try:
+            theme_data = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            logging.error(f"Error in preview: {e}")
+            messagebox.showerror("Error", f"Preview failed: {e}")
+            return
+            
+        self.show_preview_window(theme_data)
+        
+    def load_preview_data(self, load):
+        """Load theme data and prepare everything the preview window shows, run in the interactive lane.
+        
+        The background is decoded once, reduced towards the preview size, and
+        both the blended preview and the suggested colors are made from that
+        image, so the main thread only has to display them.
+        """
+        theme_data = load()
+        theme_data.update(preview_image=None, preview_error=None, suggestion=None)
+        data = theme_data["background_image"]
+        if data is None:
+            return theme_data
+            
+        try:
+            img = reduced(open_bounded(data), PREVIEW_SIZE)
+            theme_data["preview_image"] = render_preview(img, theme_data["background_color"], PREVIEW_SIZE)
+        except ImageTooLargeError as e:
+            logging.warning(f"Background too large to preview: {e}")
+            theme_data["preview_error"] = "Image Too Large"
+            return theme_data
+        except Exception as e:
+            logging.error(f"Error creating image preview: {e}")
+            theme_data["preview_error"] = "Error Loading Image"
+            return theme_data
+            
+        if NUMPY_AVAILABLE:
+            try:
+                if self.palette_analyzer is None:
+                    from theme_palette import PaletteAnalyzer
+                    self.palette_analyzer = PaletteAnalyzer()
+                theme_data["suggestion"] = self.palette_analyzer.suggest(
+                    data,
+                    primary_alpha=(theme_data["primary_color"] >> 24) & 0xFF,
+                    background_alpha=(theme_data["background_color"] >> 24) & 0xFF,
+                    img=img)
+                self.palette_analyzer.save_cache()
+            except Exception as e:
+                logging.error(f"Error suggesting palette: {e}")
+        return theme_data
+        
+    def resolver_for(self, theme_path):
+        """Layered theme resolver of a theme directory, kept while the directory stays the same"""
+        resolver = self.theme_resolver
+        if resolver is None or resolver.theme_path != theme_path:
+            resolver = self.theme_resolver = ThemeResolver(theme_path)
+        return resolver
+        
+    def get_import_theme_data(self, theme_path, theme_name):
+        """Get theme data for import preview, merged over its parent themes"""
+        resolver = self.resolver_for(theme_path)
+        resolved = resolver.resolve(theme_name)
+        colors = resolved.colors
+        background = resolver.read_assets(resolved, ["background.png"]).get("background.png")
             
-        # Parse theme data
-        theme_data = {}
-        with open(config_file, "r") as file:
-            for line in file:
-                if ":" in line:
-                    key, value = line.strip().split(":")
-                    theme_data[key.strip('"')] = int(value.strip().strip(','))
-                    
         return {
-            "primary_color": theme_data.get("primary_color", 0),
-            "background_color": theme_data.get("background_color", 0),
-            "background_image": os.path.join(theme_dir, "background.png"),
-            "cleanup_path": os.path.join(theme_path, "temp_preview") if selected_theme.endswith(".zip") else None
+            "primary_color": colors.get("primary_color", 0),
+            "background_color": colors.get("background_color", 0),
+            "background_image": background,
         }
         
-    def get_export_theme_data(self):
+    def get_export_theme_data(self, config_path):
         """Get theme data for export preview"""
-        config_path = self.widgets["path_entry"].get()
         bbs_config_path = os.path.join(config_path, "settings", "bbs.json")
-        
         if not os.path.exists(bbs_config_path):
-            messagebox.showerror("Error", "bbs.json not found!")
-            return None
-            
-        with open(bbs_config_path, "r") as file:
-            config = json.load(file)
+            raise Exception("bbs.json not found!")
             
+        config = json.loads(read_file(bbs_config_path))
+        background_path = os.path.join(config_path, "assets", "textures", "background.png")
+        
         return {
             "primary_color": config["appearance"].get("primary_color", 0),
             "background_color": config["background"].get("color", 0),
-            "background_image": os.path.join(config_path, "assets", "textures", "background.png"),
-            "cleanup_path": None
+            "background_image": read_file(background_path) if os.path.exists(background_path) else None,
         }
         
+    @watched("build preview window")
     def show_preview_window(self, theme_data):
         """Show modern preview window"""
         preview_window = tk.Toplevel(self.root)
         preview_window.title("Theme Preview")
-        preview_window.geometry("500x600")
+        preview_window.geometry("500x680")
         preview_window.configure(bg=ColorScheme.BG_PRIMARY)
         preview_window.resizable(False, False)
         
@@ -794,15 +1694,11 @@ class BBSThemeTool:
         self.create_color_preview(content_frame, "Background Color", theme_data["background_color"])
         
         # Background image preview
-        self.create_image_preview(content_frame, theme_data["background_image"], theme_data["background_color"])
+        self.create_image_preview(content_frame, theme_data["preview_image"], theme_data["preview_error"],
+                                  theme_data["background_color"])
         
-        # Cleanup
-        def on_close():
-            if theme_data["cleanup_path"] and os.path.exists(theme_data["cleanup_path"]):
-                shutil.rmtree(theme_data["cleanup_path"])
-            preview_window.destroy()
-            
-        preview_window.protocol("WM_DELETE_WINDOW", on_close)
+        # Palette suggestions
+        self.create_palette_suggestion(content_frame, theme_data["suggestion"])
         
     def create_color_preview(self, parent, label_text, color_int):
         """Create color preview section"""
@@ -835,8 +1731,8 @@ class BBSThemeTool:
                            font=("Arial", 9))
         hex_label.pack(anchor="w")
         
-    def create_image_preview(self, parent, image_path, bg_color_int):
-        """Create image preview section"""
+    def create_image_preview(self, parent, preview_image, preview_error, bg_color_int):
+        """Create image preview section from the preview prepared by load_preview_data"""
         section_frame = tk.Frame(parent, bg=ColorScheme.BG_PRIMARY)
         section_frame.pack(fill="x", pady=20)
         
@@ -850,38 +1746,45 @@ class BBSThemeTool:
         canvas_frame = tk.Frame(section_frame, bg=ColorScheme.BG_CARD, relief=tk.FLAT)
         canvas_frame.pack(fill="x", pady=5)
         
-        preview_canvas = tk.Canvas(canvas_frame, width=400, height=200, highlightthickness=0)
+        preview_canvas = tk.Canvas(canvas_frame, width=PREVIEW_SIZE[0], height=PREVIEW_SIZE[1], highlightthickness=0)
         preview_canvas.pack(padx=10, pady=10)
         
-        # Convert background color
-        alpha = (bg_color_int >> 24) & 0xFF
-        rgb = bg_color_int & 0xFFFFFF
-        hex_color = f"#{rgb:06x}"
-        alpha_percent = alpha / 255.0
-        
-        try:
-            if os.path.exists(image_path):
-                # Load and blend image
-                rgb_tuple = ImageColor.getrgb(hex_color)
-                bg_image = Image.new("RGBA", (400, 200), rgb_tuple + (int(alpha_percent * 255),))
-                
-                img = Image.open(image_path).convert("RGBA").resize((400, 200), Image.NEAREST)
-                combined = Image.blend(bg_image, img, 0.6)
-                
-                photo = ImageTk.PhotoImage(combined)
-                preview_canvas.create_image(200, 100, image=photo)
-                preview_canvas.image = photo  # Keep reference
-            else:
-                # Show color only
-                preview_canvas.configure(bg=hex_color)
-                preview_canvas.create_text(200, 100, text="Image Not Found", 
-                                         fill=ColorScheme.TEXT_PRIMARY, font=("Arial", 12))
-        except Exception as e:
-            logging.error(f"Error creating image preview: {e}")
-            preview_canvas.configure(bg=hex_color)
-            preview_canvas.create_text(200, 100, text="Error Loading Image", 
+        if preview_image is not None:
+            photo = ImageTk.PhotoImage(preview_image)
+            preview_canvas.create_image(PREVIEW_SIZE[0] // 2, PREVIEW_SIZE[1] // 2, image=photo)
+            preview_canvas.image = photo  # Keep reference
+        else:
+            # Show color only
+            preview_canvas.configure(bg=f"#{bg_color_int & 0xFFFFFF:06x}")
+            preview_canvas.create_text(PREVIEW_SIZE[0] // 2, PREVIEW_SIZE[1] // 2,
+                                     text=preview_error or "Image Not Found",
                                      fill=ColorScheme.TEXT_PRIMARY, font=("Arial", 12))
             
+    def create_palette_suggestion(self, parent, suggestion):
+        """Show the primary and background colors suggested from the background image"""
+        if suggestion is None:
+            return
+            
+        section_frame = tk.Frame(parent, bg=ColorScheme.BG_PRIMARY)
+        section_frame.pack(fill="x")
+        
+        label = tk.Label(section_frame, text="Suggested Colors", 
+                        bg=ColorScheme.BG_PRIMARY, fg=ColorScheme.TEXT_PRIMARY,
+                        font=("Arial", 11, "bold"))
+        label.pack(anchor="w", pady=(0, 5))
+        
+        for key in ["primary_color", "background_color"]:
+            row = tk.Frame(section_frame, bg=ColorScheme.BG_PRIMARY)
+            row.pack(fill="x", pady=2)
+            
+            swatch = tk.Frame(row, bg=f"#{suggestion[key] & 0xFFFFFF:06x}", width=40, height=20)
+            swatch.pack(side="left", padx=(0, 8))
+            
+            value_label = tk.Label(row, text=f'"{key}": {suggestion[key]}', 
+                                 bg=ColorScheme.BG_PRIMARY, fg=ColorScheme.TEXT_SECONDARY,
+                                 font=("Arial", 9))
+            value_label.pack(side="left")
+            
     def execute_operation(self):
         """Execute the selected operation"""
         if self.import_mode.get():
@@ -891,6 +1794,7 @@ class BBSThemeTool:
         else:
             messagebox.showerror("Error", "Please select an operation mode.")
             
+    @watched("import theme")
     def execute_import(self):
         """Execute theme import operation"""
         config_path = self.widgets["path_entry"].get()
@@ -907,13 +1811,18 @@ class BBSThemeTool:
             messagebox.showerror("Error", "Please select a theme to import.")
             return
             
+        max_background_size = None
+        if self.downscale_background.get():
+            max_background_size = tuple(int(v) for v in self.downscale_size.get().split("x"))
+            
         try:
-            self.import_theme(config_path, selected_theme)
+            self.import_theme(config_path, selected_theme, max_background_size)
             messagebox.showinfo("Success", "Theme imported successfully!")
         except Exception as e:
             logging.error(f"Import error: {e}")
             messagebox.showerror("Error", f"Import failed: {e}")
             
+    @watched("export theme")
     def execute_export(self):
         """Execute theme export operation"""
         config_path = self.widgets["path_entry"].get()
@@ -931,129 +1840,58 @@ class BBSThemeTool:
             return
             
         try:
-            self.export_theme(config_path, export_name)
+            self.export_theme(config_path, export_name, self.optimize_export.get())
             export_type = "ZIP file" if self.export_type.get() == "zip" else "folder"
             messagebox.showinfo("Success", f"Theme exported successfully as {export_type}!")
         except Exception as e:
             logging.error(f"Export error: {e}")
             messagebox.showerror("Error", f"Export failed: {e}")
             
-    def import_theme(self, config_path: str, theme_name: str):
+    def import_theme(self, config_path: str, theme_name: str, max_background_size: Tuple[int, int] = None):
         """Import theme implementation"""
-        theme_path = os.path.join(config_path, "theme")
-        bbs_config_path = os.path.join(config_path, "settings", "bbs.json")
-        textures_path = os.path.join(config_path, "assets", "textures")
+        self.io.run(INTERACTIVE, theme_operations.import_theme, config_path, theme_name, max_background_size,
+                    self.scaled_backgrounds, self.resolver_for(os.path.join(config_path, "theme")))
         
-        os.makedirs(textures_path, exist_ok=True)
-        
-        # Handle ZIP extraction
-        if theme_name.endswith(".zip"):
-            temp_dir = os.path.join(theme_path, "temp_import")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            try:
-                shutil.unpack_archive(os.path.join(theme_path, theme_name), temp_dir)
-                config_files = glob.glob(os.path.join(temp_dir, '**', 'config.txt'), recursive=True)
-                if not config_files:
-                    raise Exception("config.txt not found in ZIP file!")
-                    
-                theme_config_file = config_files[0]
-                theme_dir = os.path.dirname(theme_config_file)
-            except Exception as e:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-                raise e
-        else:
-            theme_config_file = os.path.join(theme_path, theme_name, "config.txt")
-            theme_dir = os.path.join(theme_path, theme_name)
-            
-        if not os.path.exists(theme_config_file):
-            raise Exception("config.txt not found in theme!")
-            
-        # Parse theme configuration
-        theme_data = {}
-        with open(theme_config_file, "r") as file:
-            for line in file:
-                if ":" in line:
-                    key, value = line.strip().split(":")
-                    theme_data[key.strip('"')] = int(value.strip().strip(','))
-                    
-        # Update BBS configuration
-        with open(bbs_config_path, "r") as file:
-            config = json.load(file)
-            
-        if "appearance" in config and "primary_color" in theme_data:
-            config["appearance"]["primary_color"] = theme_data["primary_color"]
-        if "background" in config and "background_color" in theme_data:
-            config["background"]["color"] = theme_data["background_color"]
-            
-        with open(bbs_config_path, "w") as file:
-            json.dump(config, file, indent=4)
-            
-        # Copy assets
-        for asset_name in ["background.png", "icons.png"]:
-            src_path = os.path.join(theme_dir, asset_name)
-            if os.path.exists(src_path):
-                shutil.copy(src_path, os.path.join(textures_path, asset_name))
-                
-        # Cleanup
-        if theme_name.endswith(".zip") and os.path.exists(os.path.join(theme_path, "temp_import")):
-            shutil.rmtree(os.path.join(theme_path, "temp_import"))
-            
-    def export_theme(self, config_path: str, theme_name: str):
+    def export_theme(self, config_path: str, theme_name: str, optimize_assets: bool = False):
         """Export theme implementation"""
+        export_type = self.export_type.get()
         theme_dir = os.path.join(config_path, "theme", theme_name)
         zip_path = os.path.join(config_path, "theme", f"{theme_name}.zip")
         
         # Check for overwrite
-        target_path = zip_path if self.export_type.get() == "zip" else theme_dir
+        target_path = zip_path if export_type == "zip" else theme_dir
         if os.path.exists(target_path):
             if not messagebox.askyesno("Confirm Overwrite", 
                                      f"'{theme_name}' already exists. Overwrite?"):
                 return
                 
-        # Create theme directory
-        if os.path.exists(theme_dir):
-            shutil.rmtree(theme_dir)
-        os.makedirs(theme_dir, exist_ok=True)
+        self.io.run(INTERACTIVE, theme_operations.export_theme, config_path, theme_name, export_type,
+                    optimize_assets, self.png_optimizer)
         
-        try:
-            # Read BBS configuration
-            bbs_config_path = os.path.join(config_path, "settings", "bbs.json")
-            with open(bbs_config_path, "r") as file:
-                config = json.load(file)
-                
-            # Create config.txt
-            config_file_path = os.path.join(theme_dir, "config.txt")
-            with open(config_file_path, "w") as file:
-                file.write('{\n')
-                file.write(f'\t"primary_color": {config["appearance"]["primary_color"]},\n')
-                file.write(f'\t"background_color": {config["background"]["color"]}\n')
-                file.write('}')
-                
-            # Copy assets
-            textures_path = os.path.join(config_path, "assets", "textures")
-            for asset_name in ["background.png", "icons.png"]:
-                src_path = os.path.join(textures_path, asset_name)
-                if os.path.exists(src_path):
-                    shutil.copy(src_path, os.path.join(theme_dir, asset_name))
-                    
-            # Handle export type
-            if self.export_type.get() == "zip":
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                shutil.make_archive(os.path.join(config_path, "theme", theme_name), 'zip', theme_dir)
-                shutil.rmtree(theme_dir)  # Remove temporary folder
-                
-        except Exception as e:
-            if os.path.exists(theme_dir):
-                shutil.rmtree(theme_dir)
-            raise e
-            
     def run(self):
         """Start the application"""
         self.root.mainloop()
+        self.watchdog.stop()
+        self.io.close()
+        
+        try:
+            if self.watchdog.export(self.stall_report):
+                logging.info(f"Stall report written to {self.stall_report}")
+        except OSError as e:
+            logging.warning(f"Could not write stall report: {e}")
 
 if __name__ == "__main__":
-    app = BBSThemeTool()
+    parser = argparse.ArgumentParser(description="BBS Theme Tool")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Print a timeline of the startup steps")
+    parser.add_argument("--stall-threshold", type=int, default=250, metavar="MS",
+                        help="Report main loop stalls longer than this")
+    parser.add_argument("--stall-report", default=STALL_REPORT_FILE,
+                        help="Where to write the stall report on exit")
+    parser.add_argument("--io-bandwidth", type=float, default=DEFAULT_BANDWIDTH / (1024 * 1024), metavar="MB/S",
+                        help="Cap on theme directory reads and writes, 0 for no cap")
+    args = parser.parse_args()
+    
+    app = BBSThemeTool(startup_profile=args.startup_profile, stall_threshold=args.stall_threshold,
+                       stall_report=args.stall_report, io_bandwidth=int(args.io_bandwidth * 1024 * 1024))
     app.run()
\ No newline at end of file
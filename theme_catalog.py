@@ -0,0 +1,431 @@
+"""Theme catalog helpers shared by the GUI and the command line tools"""
+import os
+import io
+import zlib
+import struct
+import hashlib
+import zipfile
+import logging
+import functools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from theme_io import DIRECTORY_COST, charge, read_file
+
+CONFIG_FILE = "config.txt"
+THEME_ASSETS = ["background.png", "icons.png"]
+
+# config.txt key naming the theme a layered theme builds on
+PARENT_KEY = "parent"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Local file header: signature, versions, flags, method, time, date, crc, sizes, name and extra lengths
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+# Scratch folders created by the GUI inside <config>/theme
+TEMP_DIRS = {"temp_preview", "temp_import"}
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".bbs_theme_tool")
+
+# Directories listed at once while discovering nested theme collections
+DISCOVERY_WORKERS = 16
+
+# Deepest category nesting followed
+MAX_CATEGORY_DEPTH = 8
+
+def cache_path(*parts: str) -> str:
+    """Path inside the per-user cache directory, creating its parent"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def process_pool(max_workers: int = None, **kwargs):
+    """ProcessPoolExecutor whose workers are not forked from the calling process.
+
+    Forking copies a threaded process such as the GUI, with its scheduler
+    and loader threads, and a child can hang on a lock one of them held.
+    Workers are started by a fork server where there is one and spawned
+    elsewhere.
+    """
+    # Imported here, multiprocessing is slow to import and only needed by the pools
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method), **kwargs)
+
+def parse_theme_config(text: str) -> Dict[str, int]:
+    """Parse the color lines of a theme config.txt"""
+    theme_data = {}
+    for line in text.splitlines():
+        if ":" in line:
+            key, value = line.strip().split(":", 1)
+            if key.strip('"') == PARENT_KEY:
+                continue
+            theme_data[key.strip('"')] = int(value.strip().strip(','))
+    return theme_data
+
+def parse_theme_parent(text: str) -> Optional[str]:
+    """Name of the parent theme declared in a config.txt, if any"""
+    for line in text.splitlines():
+        if ":" in line:
+            key, value = line.strip().split(":", 1)
+            if key.strip('"') == PARENT_KEY:
+                return value.strip().rstrip(',').strip().strip('"') or None
+    return None
+
+def format_theme_config(primary_color: int, background_color: int) -> str:
+    """Render a config.txt in the format written by export"""
+    return ('{\n'
+            f'\t"primary_color": {primary_color},\n'
+            f'\t"background_color": {background_color}\n'
+            '}')
+
+def format_size(size: int) -> str:
+    """Human readable byte count"""
+    if size < 1024:
+        return f"{size} B"
+    for unit in ["KB", "MB", "GB"]:
+        size /= 1024.0
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+
+def png_resolution(head: Optional[bytes]) -> Optional[Tuple[int, int]]:
+    """Width and height from the first 24 bytes of a PNG (signature and IHDR)"""
+    if not head or len(head) < 24 or not head.startswith(PNG_SIGNATURE) or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+def read_zip_member_head(fp, info: zipfile.ZipInfo, length: int) -> Optional[bytes]:
+    """First bytes of a zip member, read by offset from its local header"""
+    if info.flag_bits & 0x1:
+        return None  # Encrypted
+
+    fp.seek(info.header_offset)
+    header = fp.read(ZIP_LOCAL_HEADER.size)
+    if len(header) < ZIP_LOCAL_HEADER.size:
+        return None
+    fields = ZIP_LOCAL_HEADER.unpack(header)
+    if fields[0] != b"PK\x03\x04":
+        return None
+    fp.seek(info.header_offset + ZIP_LOCAL_HEADER.size + fields[9] + fields[10])
+
+    if info.compress_type == zipfile.ZIP_STORED:
+        return fp.read(min(length, info.file_size))
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        # A PNG header inflates from the first few hundred compressed bytes
+        chunk = fp.read(min(info.compress_size, 1024))
+        try:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(chunk, length)
+        except zlib.error:
+            return None
+    return None
+
+def scan_directory(path: str) -> Tuple[bool, List[str], List[str], bool, List[str]]:
+    """One listing of a directory.
+
+    Returns (has config.txt, zip names, subdirectory names, has theme assets,
+    names of the subdirectories that are symlinks). Only the DirEntry type
+    information is used, so no extra stat call is made per entry on
+    platforms that report types while listing.
+    """
+    charge(DIRECTORY_COST)
+    has_config = has_assets = False
+    zips, subdirs, linked = [], [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subdirs.append(entry.name)
+                if entry.is_symlink():
+                    linked.append(entry.name)
+            elif entry.name == CONFIG_FILE:
+                has_config = True
+            elif entry.name in THEME_ASSETS:
+                has_assets = True
+            elif entry.name.endswith(".zip") and entry.is_file():
+                zips.append(entry.name)
+    return has_config, zips, subdirs, has_assets, linked
+
+def discover_themes(theme_path: str, max_workers: int = DISCOVERY_WORKERS, scheduler=None,
+                    lane: int = None, tag=None) -> List[str]:
+    """Find themes in the theme directory and its category subfolders.
+
+    A folder with a config.txt is a theme, a folder without one is a
+    category that is searched further; zips are themes wherever they are.
+    Folders holding theme assets but no config.txt or sub-themes are kept
+    so validation can report them. Subtrees are listed in parallel, so a
+    deep network share costs about one round trip per level. Names are
+    paths relative to the theme directory with "/" separators. With a
+    scheduler the listings run in its lane instead of a private thread pool,
+    submitted with tag so cancelling it stops the scan.
+    """
+    if not os.path.isdir(theme_path):
+        return []
+
+    if scheduler is not None:
+        return _discover(theme_path, functools.partial(scheduler.submit, lane, tag=tag))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return _discover(theme_path, executor.submit)
+
+def _discover(theme_path: str, submit: Callable) -> List[str]:
+    """Breadth-first listing of the theme directory, each directory listed once by its real path"""
+    themes = []
+    root = os.path.realpath(theme_path)
+    visited = {root}
+    pending = {submit(scan_directory, theme_path): ("", root)}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            relative, real = pending.pop(future)
+            try:
+                has_config, zips, subdirs, has_assets, linked = future.result()
+            except OSError as e:
+                logging.warning(f"Cannot list {relative or theme_path}: {e}")
+                continue
+
+            if relative and has_config:
+                themes.append(relative)
+                continue
+            prefix = f"{relative}/" if relative else ""
+            themes.extend(prefix + name for name in zips)
+            if relative and has_assets and not zips and not subdirs:
+                themes.append(relative)
+
+            depth = relative.count("/") + 1 if relative else 0
+            if depth >= MAX_CATEGORY_DEPTH:
+                continue
+            for name in subdirs:
+                if not relative and name in TEMP_DIRS:
+                    continue
+                path = os.path.join(theme_path, prefix + name)
+                # A symlink back up the tree or to a folder already listed is not followed;
+                # only symlinks need resolving, a plain folder's real path follows from its parent's
+                child = os.path.realpath(path) if name in linked else os.path.join(real, name)
+                if child in visited:
+                    continue
+                visited.add(child)
+                pending[submit(scan_directory, path)] = (prefix + name, child)
+    # Grouped by category, themes directly in the theme directory first
+    return sorted(themes, key=lambda name: (theme_category(name), name))
+
+def list_themes(theme_path: str, scheduler=None, lane: int = None, tag=None) -> List[str]:
+    """List theme folders and zips in the theme directory, including category subfolders"""
+    return discover_themes(theme_path, scheduler=scheduler, lane=lane, tag=tag)
+
+def theme_category(theme_name: str) -> str:
+    """Category path of a theme, empty for themes directly in the theme directory"""
+    return theme_name.rpartition("/")[0]
+
+def theme_stem(theme_name: str) -> str:
+    """Theme name without the .zip suffix"""
+    return theme_name[:-4] if theme_name.endswith(".zip") else theme_name
+
+def find_zip_config(names: List[str]) -> Optional[str]:
+    """Pick the config.txt member of a theme zip, preferring the shallowest one"""
+    candidates = [n for n in names if os.path.basename(n) == CONFIG_FILE]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda n: (n.count("/"), n))
+
+def theme_fingerprint(theme_path: str, theme_name: str) -> Tuple:
+    """Cheap stat based fingerprint that changes whenever theme content does"""
+    full_path = os.path.join(theme_path, theme_name)
+    if not os.path.isdir(full_path):
+        st = os.stat(full_path)
+        return (st.st_size, st.st_mtime_ns)
+
+    parts = []
+    for file_name in [CONFIG_FILE] + THEME_ASSETS:
+        try:
+            st = os.stat(os.path.join(full_path, file_name))
+            parts.append((file_name, st.st_size, st.st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(parts)
+
+def theme_disk_size(theme_path: str, theme_name: str) -> int:
+    """Bytes a theme occupies on disk, from stat calls only"""
+    full_path = os.path.join(theme_path, theme_name)
+    if not os.path.isdir(full_path):
+        return os.path.getsize(full_path)
+    return sum(os.path.getsize(os.path.join(full_path, f))
+               for f in [CONFIG_FILE] + THEME_ASSETS
+               if os.path.exists(os.path.join(full_path, f)))
+
+class ThemeSource:
+    """Reads config and assets of a theme folder or zip without extracting it"""
+
+    def __init__(self, theme_path: str, theme_name: str):
+        self.name = theme_name
+        self.path = os.path.join(theme_path, theme_name)
+        self.is_zip = theme_name.endswith(".zip") and not os.path.isdir(self.path)
+        self._zip = None
+        self._prefix = ""
+
+        if self.is_zip:
+            self._zip = zipfile.ZipFile(self.path)
+            config_member = find_zip_config(self._zip.namelist())
+            if config_member is None:
+                self._zip.close()
+                raise Exception("config.txt not found in ZIP file!")
+            self._prefix = config_member[:-len(CONFIG_FILE)]
+        elif not os.path.exists(os.path.join(self.path, CONFIG_FILE)):
+            raise Exception("config.txt not found in theme!")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def test_archive(self) -> Optional[str]:
+        """Name of the first zip member failing its CRC check, if any"""
+        return self._zip.testzip() if self.is_zip else None
+
+    def read_bytes(self, file_name: str) -> Optional[bytes]:
+        """Read a theme file, returning None when it is missing"""
+        if self.is_zip:
+            try:
+                info = self._zip.getinfo(self._prefix + file_name)
+            except KeyError:
+                return None
+            charge(info.compress_size)
+            return self._zip.read(info)
+
+        file_path = os.path.join(self.path, file_name)
+        if not os.path.exists(file_path):
+            return None
+        return read_file(file_path)
+
+    def read_head(self, file_name: str, length: int) -> Optional[bytes]:
+        """First bytes of a theme file without reading the rest of it"""
+        if self.is_zip:
+            try:
+                info = self._zip.getinfo(self._prefix + file_name)
+            except KeyError:
+                return None
+            charge(length)
+            with open(self.path, "rb") as fp:
+                return read_zip_member_head(fp, info, length)
+
+        file_path = os.path.join(self.path, file_name)
+        if not os.path.exists(file_path):
+            return None
+        charge(length)
+        with open(file_path, "rb") as file:
+            return file.read(length)
+
+    def background_resolution(self) -> Optional[Tuple[int, int]]:
+        """Size of background.png read from its IHDR chunk"""
+        return png_resolution(self.read_head("background.png", 24))
+
+    def read_config(self) -> Dict[str, int]:
+        """Parse the theme config.txt"""
+        return parse_theme_config(self.read_bytes(CONFIG_FILE).decode("utf-8"))
+
+    def asset_sizes(self) -> Dict[str, int]:
+        """Uncompressed size of each asset present in the theme"""
+        sizes = {}
+        for asset_name in THEME_ASSETS:
+            if self.is_zip:
+                try:
+                    sizes[asset_name] = self._zip.getinfo(self._prefix + asset_name).file_size
+                except KeyError:
+                    continue
+            else:
+                asset_path = os.path.join(self.path, asset_name)
+                if os.path.exists(asset_path):
+                    sizes[asset_name] = os.path.getsize(asset_path)
+        return sizes
+
+    def total_size(self) -> int:
+        """Size of the theme on disk"""
+        if self.is_zip:
+            return os.path.getsize(self.path)
+        return sum(os.path.getsize(os.path.join(self.path, f))
+                   for f in [CONFIG_FILE] + THEME_ASSETS
+                   if os.path.exists(os.path.join(self.path, f)))
+
+    def to_zip_bytes(self) -> bytes:
+        """Pack the theme into a deterministic zip archive"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_name in [CONFIG_FILE] + THEME_ASSETS:
+                data = self.read_bytes(file_name)
+                if data is None:
+                    continue
+                info = zipfile.ZipInfo(file_name, date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, data)
+        return buffer.getvalue()
+
+def content_hash(source: "ThemeSource") -> str:
+    """Hash of the config and every asset of a theme"""
+    digest = hashlib.sha1()
+    for file_name in [CONFIG_FILE] + THEME_ASSETS:
+        data = source.read_bytes(file_name)
+        digest.update(file_name.encode("utf-8"))
+        digest.update(b"\0" if data is None else hashlib.sha1(data).digest())
+    return digest.hexdigest()
+
+def describe_theme(theme_path: str, theme_name: str, resolver) -> Dict:
+    """Build the catalog record of a single theme.
+
+    Colors, assets and resolution are those of the theme merged with its
+    parents by resolver, a theme_layers.ThemeResolver; kind and size are
+    those of the theme itself.
+    """
+    resolved = resolver.resolve(theme_name)
+    with ThemeSource(theme_path, theme_name) as source:
+        kind = "zip" if source.is_zip else "folder"
+        size = source.total_size()
+    return {
+        "name": theme_name,
+        "kind": kind,
+        "parent": resolved.parent,
+        "primary_color": resolved.colors.get("primary_color", 0),
+        "background_color": resolved.colors.get("background_color", 0),
+        "assets": resolved.sizes,
+        "resolution": resolver.background_resolution(resolved),
+        "size": size,
+    }
+
+class ThemeCatalog:
+    """In-memory catalog that only re-reads themes whose fingerprint changed.
+
+    Fingerprints cover a theme's whole parent chain, so editing a parent
+    refreshes the records of every theme built on it.
+    """
+
+    def __init__(self, theme_path: str, resolver):
+        self.theme_path = theme_path
+        self.resolver = resolver
+        self.entries = {}
+
+    def refresh(self) -> List[Dict]:
+        """Rescan the theme directory and return the current records"""
+        records = []
+        seen = set()
+        for theme_name in list_themes(self.theme_path):
+            seen.add(theme_name)
+            try:
+                fingerprint = self.resolver.resolve(theme_name).fingerprint
+                cached = self.entries.get(theme_name)
+                if cached is None or cached[0] != fingerprint:
+                    cached = (fingerprint, describe_theme(self.theme_path, theme_name, self.resolver))
+                    self.entries[theme_name] = cached
+                records.append(cached[1])
+            except Exception as e:
+                logging.warning(f"Skipping theme {theme_name}: {e}")
+
+        for theme_name in list(self.entries):
+            if theme_name not in seen:
+                del self.entries[theme_name]
+        return records
@@ -0,0 +1,198 @@
+"""Incremental static catalog builder for the web gallery"""
+import os
+import re
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from theme_catalog import list_themes, theme_disk_size, theme_stem
+from theme_layers import ThemeResolver
+
+THUMBNAIL_SIZE = (320, 180)
+STATE_FILE = "build-state.json"
+CATALOG_FILE = "catalog.json"
+THUMB_DIR = "thumbs"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def argb_to_hex(color_int: int) -> str:
+    """CSS hex color of an ARGB integer from config.txt"""
+    return f"#{color_int & 0xFFFFFF:06x}"
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase search tokens of a theme name"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def render_thumbnails(data: Optional[bytes], out_dir: str, thumb_id: str, webp: bool) -> Dict[str, str]:
+    """Write PNG and WebP thumbnails of a background image"""
+    from PIL import Image
+    from theme_images import open_bounded
+
+    if data is None:
+        return {}
+
+    # Decompression bombs are refused like everywhere else, the theme is then skipped
+    img = open_bounded(data)
+    img.draft("RGB", THUMBNAIL_SIZE)
+    img = img.convert("RGB")
+    img.thumbnail(THUMBNAIL_SIZE, Image.BILINEAR, reducing_gap=2.0)
+
+    thumbs = {}
+    png_name = f"{thumb_id}.png"
+    img.save(os.path.join(out_dir, png_name), "PNG", optimize=True)
+    thumbs["png"] = f"{THUMB_DIR}/{png_name}"
+    if webp:
+        webp_name = f"{thumb_id}.webp"
+        img.save(os.path.join(out_dir, webp_name), "WEBP", quality=80, method=4)
+        thumbs["webp"] = f"{THUMB_DIR}/{webp_name}"
+    return thumbs
+
+def process_theme(theme_path: str, theme_name: str, out_dir: str,
+                  known_hash: Optional[str], webp: bool) -> Tuple[str, Optional[Dict]]:
+    """Hash a theme and rebuild its record when the content changed.
+
+    Runs in a worker process. Returns the content hash and a fresh record,
+    or None for the record when the hash matches known_hash.
+    """
+    resolver = ThemeResolver(theme_path)
+    resolved = resolver.resolve(theme_name)
+    digest = resolver.content_hash(resolved)
+    if digest == known_hash:
+        return digest, None
+
+    colors = resolved.colors
+    primary = colors.get("primary_color", 0)
+    background = colors.get("background_color", 0)
+    record = {
+        "name": theme_name,
+        "kind": "folder" if os.path.isdir(os.path.join(theme_path, theme_name)) else "zip",
+        "parent": resolved.parent,
+        "hash": digest,
+        "primary_color": primary,
+        "background_color": background,
+        "bg": argb_to_hex(background),
+        "text": argb_to_hex(primary),
+        "accent": argb_to_hex(primary),
+        "border": argb_to_hex(primary),
+        "size": theme_disk_size(theme_path, theme_name),
+        "thumbnails": render_thumbnails(resolver.read_assets(resolved, ["background.png"]).get("background.png"),
+                                        out_dir, digest[:16], webp),
+    }
+    return digest, record
+
+def build_search_index(records: List[Dict]) -> List[List]:
+    """Sorted [token, [theme ids]] pairs for prefix search in the browser"""
+    postings = {}
+    for theme_id, record in enumerate(records):
+        for token in set(tokenize(theme_stem(record["name"]))):
+            postings.setdefault(token, []).append(theme_id)
+    return [[token, postings[token]] for token in sorted(postings)]
+
+class CatalogBuilder:
+    """Builds catalog.json and thumbnails, reprocessing only changed themes"""
+
+    def __init__(self, config_path: str, output_dir: str, max_workers: int = None):
+        self.theme_path = os.path.join(config_path, "theme")
+        self.output_dir = output_dir
+        self.thumb_dir = os.path.join(output_dir, THUMB_DIR)
+        self.max_workers = max_workers
+        self.state = self.load_state()
+
+    def load_state(self) -> Dict:
+        try:
+            with open(os.path.join(self.output_dir, STATE_FILE), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        with open(os.path.join(self.output_dir, STATE_FILE), "w") as file:
+            json.dump(self.state, file)
+
+    def build(self) -> Dict[str, int]:
+        """Run an incremental build and return counts of what was done"""
+        from PIL import features
+
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        webp = features.check("webp")
+        names = list_themes(self.theme_path)
+        stats = {"themes": len(names), "rehashed": 0, "rebuilt": 0, "removed": 0}
+
+        # Themes whose stat fingerprints, their parents' included, are unchanged are never opened
+        resolver = ThemeResolver(self.theme_path)
+        pending = []
+        for theme_name in names:
+            try:
+                fingerprint = json.loads(json.dumps(resolver.resolve(theme_name).fingerprint))
+            except Exception as e:
+                logging.warning(f"Skipping theme {theme_name}: {e}")
+                self.state.pop(theme_name, None)
+                continue
+            entry = self.state.get(theme_name)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                pending.append((theme_name, fingerprint))
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = []
+                for theme_name, fingerprint in pending:
+                    entry = self.state.get(theme_name) or {}
+                    futures.append((theme_name, fingerprint, executor.submit(
+                        process_theme, self.theme_path, theme_name, self.thumb_dir,
+                        entry.get("hash"), webp)))
+
+                for theme_name, fingerprint, future in futures:
+                    stats["rehashed"] += 1
+                    try:
+                        digest, record = future.result()
+                    except Exception as e:
+                        logging.warning(f"Skipping theme {theme_name}: {e}")
+                        self.state.pop(theme_name, None)
+                        continue
+                    entry = self.state.get(theme_name) or {}
+                    if record is not None:
+                        stats["rebuilt"] += 1
+                        entry["record"] = record
+                    entry.update(fingerprint=fingerprint, hash=digest)
+                    self.state[theme_name] = entry
+
+        for theme_name in list(self.state):
+            if theme_name not in names:
+                del self.state[theme_name]
+                stats["removed"] += 1
+
+        records = [self.state[name]["record"] for name in names if name in self.state]
+        self.write_catalog(records)
+        self.remove_stale_thumbnails(records)
+        self.save_state()
+        return stats
+
+    def write_catalog(self, records: List[Dict]):
+        catalog = {"themes": records, "index": build_search_index(records)}
+        temp_path = os.path.join(self.output_dir, CATALOG_FILE + ".tmp")
+        with open(temp_path, "w") as file:
+            json.dump(catalog, file, separators=(",", ":"))
+        os.replace(temp_path, os.path.join(self.output_dir, CATALOG_FILE))
+
+    def remove_stale_thumbnails(self, records: List[Dict]):
+        in_use = {os.path.basename(path) for record in records for path in record["thumbnails"].values()}
+        for entry in os.scandir(self.thumb_dir):
+            if entry.name not in in_use:
+                os.remove(entry.path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the static theme catalog for the web gallery")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("--output", default="catalog", help="Output directory (default: catalog)")
+    parser.add_argument("--workers", type=int, default=None, help="Thumbnail worker processes")
+    args = parser.parse_args()
+
+    stats = CatalogBuilder(args.config, args.output, args.workers).build()
+    logging.info(f"Catalog built: {stats['themes']} themes, {stats['rebuilt']} rebuilt, "
+                 f"{stats['rehashed'] - stats['rebuilt']} unchanged after hashing, {stats['removed']} removed")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
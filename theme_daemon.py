@@ -0,0 +1,351 @@
+"""Resident daemon serving theme operations to launchers over a Unix socket.
+
+Requests and responses are single-line JSON objects:
+
+    {"id": 1, "op": "search", "query": "neon"}
+    {"id": 1, "ok": true, "result": [...]}
+
+Requests on one connection are served concurrently, so responses can arrive
+out of order and are matched by id.
+"""
+import os
+import io
+import json
+import time
+import base64
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from theme_catalog import ThemeCatalog, cache_path, theme_stem
+from theme_catalog_build import tokenize
+from theme_images import PngOptimizer, ScaledBackgroundCache, render_preview
+from theme_layers import ThemeLayerError, ThemeResolver
+import theme_operations
+
+DEFAULT_SOCKET = cache_path("daemon.sock")
+
+# Seconds a directory scan is reused before list and search rescan
+REFRESH_INTERVAL = 2.0
+
+# Parsed themes, with their asset bytes, and rendered previews kept in memory
+MAX_CACHED_THEMES = 64
+MAX_CACHED_PREVIEWS = 256
+
+PREVIEW_SIZE = (400, 200)
+
+# Largest width and height accepted for previews and import downscaling
+MAX_REQUEST_SIZE = 4096
+
+# Longest request line accepted from a client
+MAX_REQUEST_BYTES = 1024 * 1024
+
+class DaemonError(Exception):
+    """Raised for requests the daemon refuses"""
+
+def request_size(value, field: str) -> Tuple[int, int]:
+    """Validate a [width, height] request field"""
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) and 0 < v <= MAX_REQUEST_SIZE for v in value)):
+        raise DaemonError(f"{field} must be [width, height] between 1 and {MAX_REQUEST_SIZE}")
+    return tuple(value)
+
+def is_plain_name(name) -> bool:
+    """True for a theme name that stays a single entry of the theme directory"""
+    if not isinstance(name, str) or name in ("", ".", ".."):
+        return False
+    return not any(sep and sep in name for sep in (os.sep, os.altsep))
+
+class ThemeDaemon:
+    """Keeps the catalog, parsed themes and previews of one config directory warm"""
+
+    def __init__(self, config_path: str, socket_path: str = DEFAULT_SOCKET, max_workers: int = None):
+        self.config_path = config_path
+        self.theme_path = os.path.join(config_path, "theme")
+        self.socket_path = socket_path
+        self.resolver = ThemeResolver(self.theme_path)
+        self.catalog = ThemeCatalog(self.theme_path, self.resolver)
+        self.records = []
+        self.records_by_name = {}
+        self.scanned_at = 0.0
+        self.cache_lock = threading.Lock()
+        self.themes = OrderedDict()
+        self.previews = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.scaled_backgrounds = ScaledBackgroundCache()
+        self.png_optimizer = PngOptimizer()
+        self.scan_lock = None
+        self.write_lock = None
+        self.handlers = {
+            "list": self.op_list,
+            "search": self.op_search,
+            "preview": self.op_preview,
+            "import": self.op_import,
+            "export": self.op_export,
+        }
+
+    async def run_blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def refresh(self, force: bool = False):
+        """Rescan the theme directory unless the last scan is recent enough"""
+        async with self.scan_lock:
+            if not force and time.monotonic() - self.scanned_at < REFRESH_INTERVAL:
+                return
+            records = await self.run_blocking(self.catalog.refresh)
+            self.records = records
+            self.records_by_name = {record["name"]: record for record in records}
+            self.scanned_at = time.monotonic()
+
+    async def require_theme(self, theme_name) -> Dict:
+        """Catalog record of a theme, refusing names outside the catalog"""
+        if not isinstance(theme_name, str) or not theme_name:
+            raise DaemonError("A theme name is required")
+        if theme_name not in self.records_by_name:
+            await self.refresh(force=True)
+        record = self.records_by_name.get(theme_name)
+        if record is None:
+            raise DaemonError(f"Unknown theme: {theme_name}")
+        return record
+
+    def load_theme(self, theme_name: str) -> Tuple:
+        """(fingerprint, colors, assets) of a theme merged over its parents, re-read only when one changed"""
+        resolved = self.resolver.resolve(theme_name)
+        fingerprint = resolved.fingerprint
+        with self.cache_lock:
+            cached = self.themes.get(theme_name)
+            if cached is not None and cached[0] == fingerprint:
+                self.themes.move_to_end(theme_name)
+                return cached
+
+        entry = (fingerprint, dict(resolved.colors), self.resolver.read_assets(resolved))
+        with self.cache_lock:
+            self.themes[theme_name] = entry
+            while len(self.themes) > MAX_CACHED_THEMES:
+                self.themes.popitem(last=False)
+        return entry
+
+    def render_preview(self, theme_name: str, size: Tuple[int, int]) -> bytes:
+        """PNG preview of a theme, cached per theme version and size"""
+        fingerprint, colors, assets = self.load_theme(theme_name)
+        key = (theme_name, fingerprint, size)
+        with self.cache_lock:
+            cached = self.previews.get(key)
+            if cached is not None:
+                self.previews.move_to_end(key)
+                return cached
+
+        bg_color_int = colors.get("background_color", 0)
+        if "background.png" in assets:
+            img = render_preview(assets["background.png"], bg_color_int, size)
+        else:
+            img = Image.new("RGB", size, f"#{bg_color_int & 0xFFFFFF:06x}")
+        output = io.BytesIO()
+        img.save(output, "PNG")
+        data = output.getvalue()
+
+        with self.cache_lock:
+            self.previews[key] = data
+            while len(self.previews) > MAX_CACHED_PREVIEWS:
+                self.previews.popitem(last=False)
+        return data
+
+    def apply_cached_theme(self, theme_name: str, max_background_size: Optional[Tuple[int, int]]):
+        _, colors, assets = self.load_theme(theme_name)
+        theme_operations.apply_theme(self.config_path, colors, assets, max_background_size, self.scaled_backgrounds)
+
+    async def op_list(self, request: Dict) -> List[Dict]:
+        await self.refresh()
+        return self.records
+
+    async def op_search(self, request: Dict) -> List[Dict]:
+        """Themes whose name has a token starting with every query token"""
+        await self.refresh()
+        query = tokenize(str(request.get("query", "")))
+        results = []
+        for record in self.records:
+            name_tokens = tokenize(theme_stem(record["name"]))
+            if all(any(token.startswith(term) for token in name_tokens) for term in query):
+                results.append(record)
+        return results
+
+    async def op_preview(self, request: Dict) -> Dict:
+        record = await self.require_theme(request.get("theme"))
+        size = request_size(request.get("size") or PREVIEW_SIZE, "size")
+        data = await self.run_blocking(self.render_preview, record["name"], size)
+        return {"theme": record["name"], "format": "png", "data": base64.b64encode(data).decode("ascii")}
+
+    async def op_import(self, request: Dict) -> Dict:
+        record = await self.require_theme(request.get("theme"))
+        max_background_size = request.get("max_background_size")
+        if max_background_size is not None:
+            max_background_size = request_size(max_background_size, "max_background_size")
+        async with self.write_lock:
+            await self.run_blocking(self.apply_cached_theme, record["name"], max_background_size)
+        logging.info(f"Imported theme {record['name']}")
+        return {"theme": record["name"]}
+
+    async def op_export(self, request: Dict) -> Dict:
+        theme_name = request.get("name")
+        export_type = request.get("type", "zip")
+        if not is_plain_name(theme_name):
+            raise DaemonError("name must be a plain theme name")
+        if export_type not in ("zip", "folder"):
+            raise DaemonError("type must be zip or folder")
+
+        target_path = os.path.join(self.theme_path, f"{theme_name}.zip" if export_type == "zip" else theme_name)
+        async with self.write_lock:
+            if os.path.exists(target_path) and not request.get("overwrite"):
+                raise DaemonError(f"'{theme_name}' already exists")
+            await self.run_blocking(theme_operations.export_theme, self.config_path, theme_name, export_type,
+                                    bool(request.get("optimize")), self.png_optimizer)
+        # The new theme must show up in the next list
+        self.scanned_at = 0.0
+        logging.info(f"Exported theme {theme_name} as {export_type}")
+        return {"theme": os.path.basename(target_path)}
+
+    async def respond(self, line: bytes, writer: asyncio.StreamWriter, send_lock: asyncio.Lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise DaemonError("Request must be a JSON object")
+            request_id = request.get("id")
+            handler = self.handlers.get(request.get("op"))
+            if handler is None:
+                raise DaemonError(f"Unknown operation: {request.get('op')}")
+            response = {"id": request_id, "ok": True, "result": await handler(request)}
+        except Exception as e:
+            if not isinstance(e, (DaemonError, ThemeLayerError, ValueError)):
+                logging.error(f"Request failed: {e}")
+            response = {"id": request_id, "ok": False, "error": str(e)}
+
+        async with send_lock:
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        send_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    logging.warning("Dropping client that sent an oversized request")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.respond(line, writer, send_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def remove_stale_socket(self):
+        """Delete a socket file left by a daemon that is no longer running"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+
+    async def serve(self):
+        if not hasattr(socket, "AF_UNIX"):
+            raise DaemonError("Unix sockets are not supported on this platform")
+        self.scan_lock = asyncio.Lock()
+        self.write_lock = asyncio.Lock()
+        await self.refresh(force=True)
+
+        self.remove_stale_socket()
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path,
+                                                 limit=MAX_REQUEST_BYTES)
+        os.chmod(self.socket_path, 0o600)
+        logging.info(f"Serving {len(self.records)} themes on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.executor.shutdown(wait=False)
+
+class ThemeDaemonClient:
+    """Blocking client keeping one connection to the daemon"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: float = 30):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 0
+
+    def call(self, op: str, **params):
+        """Send one request and return its result"""
+        self.next_id += 1
+        request = dict(params, op=op, id=self.next_id)
+        self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise DaemonError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise DaemonError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve theme operations over a local Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Socket path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the daemon for a BBS config directory")
+    serve_parser.add_argument("config", help="BBS config directory")
+    serve_parser.add_argument("--workers", type=int, default=None)
+
+    call_parser = subparsers.add_parser("call", help="Send one request to a running daemon")
+    call_parser.add_argument("op", choices=["list", "search", "preview", "import", "export"])
+    call_parser.add_argument("params", nargs="?", default="{}", help="Request parameters as a JSON object")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        try:
+            asyncio.run(ThemeDaemon(args.config, args.socket, args.workers).serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        with ThemeDaemonClient(args.socket) as client:
+            print(json.dumps(client.call(args.op, **json.loads(args.params)), indent=2))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
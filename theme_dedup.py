@@ -0,0 +1,113 @@
+"""Duplicate theme detection across folders and zips"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from theme_catalog import THEME_ASSETS, format_size, list_themes, theme_disk_size
+from theme_layers import ThemeResolver
+
+def size_key(theme_path: str, theme_name: str, resolver: ThemeResolver = None) -> Tuple[Tuple, Tuple, int]:
+    """Prefilter key from the merged colors and asset sizes.
+
+    Keys describe the theme merged with its parents, so children of
+    different parents never match. Only config.txt files are read; asset
+    sizes come from stat or the zip central directory. Returns (colors,
+    sizes, bytes on disk).
+    """
+    resolver = resolver or ThemeResolver(theme_path)
+    resolved = resolver.resolve(theme_name)
+    return (tuple(sorted(resolved.colors.items())),
+            tuple((name, resolved.sizes.get(name)) for name in THEME_ASSETS),
+            theme_disk_size(theme_path, theme_name))
+
+def content_key(theme_path: str, theme_name: str) -> Tuple:
+    """Normalized content: merged colors plus the hash of every asset the theme ends up with"""
+    resolver = ThemeResolver(theme_path)
+    resolved = resolver.resolve(theme_name)
+    assets = resolver.read_assets(resolved)
+    hashes = []
+    for asset_name in THEME_ASSETS:
+        data = assets.get(asset_name)
+        hashes.append((asset_name, hashlib.sha256(data).hexdigest() if data is not None else None))
+    return tuple(sorted(resolved.colors.items())), tuple(hashes)
+
+def find_duplicates(theme_path: str, max_workers: int = None) -> Dict:
+    """Group identical themes and compute how many bytes removing copies frees"""
+    names = list_themes(theme_path)
+
+    # Stage 1: cheap keys, I/O bound, so threads are enough
+    prefilter = {}
+    disk_sizes = {}
+    resolver = ThemeResolver(theme_path)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = {name: executor.submit(size_key, theme_path, name, resolver) for name in names}
+        for theme_name, future in futures.items():
+            try:
+                colors, sizes, disk_size = future.result()
+            except Exception as e:
+                logging.warning(f"Skipping theme {theme_name}: {e}")
+                continue
+            disk_sizes[theme_name] = disk_size
+            prefilter.setdefault((colors, sizes), []).append(theme_name)
+
+    candidates = [name for group in prefilter.values() if len(group) > 1 for name in group]
+    # Removing a parent would break the themes built on it
+    parents = {resolver.resolve(name).parent for name in disk_sizes}
+
+    # Stage 2: full hashes, only for themes that collided on the cheap key
+    groups = {}
+    if candidates:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {name: executor.submit(content_key, theme_path, name) for name in candidates}
+            for theme_name, future in futures.items():
+                try:
+                    groups.setdefault(future.result(), []).append(theme_name)
+                except Exception as e:
+                    logging.warning(f"Skipping theme {theme_name}: {e}")
+
+    duplicates = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        # Keep parents, then folders over zips, then the shortest name
+        members.sort(key=lambda n: (n not in parents, n.endswith(".zip"), len(n), n))
+        removable = [name for name in members[1:] if name not in parents]
+        if not removable:
+            continue
+        reclaimable = sum(disk_sizes[name] for name in removable)
+        duplicates.append({"keep": members[0], "duplicates": removable, "reclaimable_bytes": reclaimable})
+
+    duplicates.sort(key=lambda g: -g["reclaimable_bytes"])
+    return {
+        "themes": len(names),
+        "hashed": len(candidates),
+        "groups": duplicates,
+        "reclaimable_bytes": sum(g["reclaimable_bytes"] for g in duplicates),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report duplicate themes in a BBS config directory")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = find_duplicates(os.path.join(args.config, "theme"), args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for group in report["groups"]:
+        print(f"{group['keep']}  ({format_size(group['reclaimable_bytes'])} reclaimable)")
+        for theme_name in group["duplicates"]:
+            print(f"    = {theme_name}")
+    print(f"{len(report['groups'])} duplicate group(s) among {report['themes']} themes, "
+          f"{report['hashed']} fully hashed, {format_size(report['reclaimable_bytes'])} reclaimable")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
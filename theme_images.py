@@ -0,0 +1,306 @@
+"""Memory-bounded image loading, background downscaling and lossless PNG optimization"""
+import os
+import io
+import hashlib
+import logging
+import threading
+import warnings
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from theme_catalog import ThemeSource, cache_path, process_pool
+
+# Images above this many pixels are refused instead of decoded
+MAX_PIXELS = 64 * 1024 * 1024
+
+# Common in-game targets offered for import downscaling
+TARGET_SIZES = [(1280, 720), (1920, 1080), (2560, 1440)]
+
+# zlib strategies tried when recompressing PNGs; Pillow picks row filters adaptively
+ZLIB_STRATEGIES = [-1, zlib.Z_FILTERED, zlib.Z_RLE]
+
+class ImageTooLargeError(Exception):
+    """Raised when an image exceeds the pixel budget"""
+
+def open_bounded(source, pixel_budget: int = MAX_PIXELS) -> Image.Image:
+    """Open an image, reading only its header, and refuse it above the pixel budget"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        try:
+            img = Image.open(source)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLargeError(str(e))
+
+    width, height = img.size
+    if width * height > pixel_budget:
+        img.close()
+        raise ImageTooLargeError(f"Image is {width}x{height}, above the {pixel_budget} pixel budget")
+    return img
+
+def fit_size(size: Tuple[int, int], max_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Largest size with the same aspect ratio that fits in max_size"""
+    width, height = size
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def resample_mode(img: Image.Image) -> str:
+    """Mode an image is expanded to before it is resampled"""
+    if "A" in img.getbands() or "transparency" in img.info:
+        return "RGBA"
+    return "L" if img.mode in ("1", "F") or img.mode.startswith("I") else "RGB"
+
+def expanded(img: Image.Image) -> Image.Image:
+    """Image converted to its resample mode.
+
+    16 bit grayscale is scaled down to 8 bits first, converting it directly
+    would clip every value above 255 to white.
+    """
+    if img.mode == "I" or img.mode.startswith("I;16"):
+        img = img.convert("I").point(lambda v: v / 256)
+    mode = resample_mode(img)
+    return img if img.mode == mode else img.convert(mode)
+
+def reduced(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Decode an image at the smallest scale that is still at least size.
+
+    JPEG data is decoded at a reduced scale by draft(); other formats are
+    box-reduced by an integer factor right after decoding, so the final
+    resampling never works on the full resolution. Palette, 1 bit and 16
+    bit images, which reduce() refuses, are expanded first.
+    """
+    img.draft(img.mode if img.mode in ("RGB", "L") else "RGB", size)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = expanded(img)
+    factor = min(img.size[0] // size[0], img.size[1] // size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def downscale(img: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
+    """Resize an image to fit in max_size with a high quality filter"""
+    target = fit_size(img.size, max_size)
+    if target == img.size:
+        return img
+    img = reduced(img, target)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    return img.resize(target, Image.LANCZOS)
+
+def load_preview(source, size: Tuple[int, int], pixel_budget: int = MAX_PIXELS) -> Image.Image:
+    """RGBA image of exactly size for previews, decoded as cheaply as possible.
+
+    source is a path, encoded bytes or an image that is already open.
+    """
+    img = source if isinstance(source, Image.Image) else open_bounded(source, pixel_budget)
+    return reduced(img, size).convert("RGBA").resize(size, Image.NEAREST)
+
+def render_preview(source, bg_color_int: int, size: Tuple[int, int], pixel_budget: int = MAX_PIXELS) -> Image.Image:
+    """Background image blended over the theme background color, as shown in previews"""
+    rgb = ((bg_color_int >> 16) & 0xFF, (bg_color_int >> 8) & 0xFF, bg_color_int & 0xFF)
+    bg_image = Image.new("RGBA", size, rgb + ((bg_color_int >> 24) & 0xFF,))
+    return Image.blend(bg_image, load_preview(source, size, pixel_budget), 0.6)
+
+def load_theme_thumbnail(theme_path: str, theme_name: str, size: Tuple[int, int]) -> Optional[Image.Image]:
+    """Thumbnail of a theme background read straight from its folder or zip, None without one"""
+    with ThemeSource(theme_path, theme_name) as source:
+        data = source.read_bytes("background.png")
+    if data is None:
+        return None
+    return load_preview(data, size)
+
+class ThumbnailLoader:
+    """Decodes thumbnails on worker threads, most wanted first.
+
+    update() replaces the wanted keys and their priorities (lower first).
+    Requests that are no longer wanted are dropped before they are decoded,
+    so a fast scroll never queues work for cells that went off screen.
+    deliver(key, image) is called on the worker thread, image is None when
+    decoding failed.
+    """
+
+    def __init__(self, decode: Callable, deliver: Callable, workers: int = 4):
+        self.decode = decode
+        self.deliver = deliver
+        self.condition = threading.Condition()
+        self.wanted = {}
+        self.active = set()
+        self.closed = False
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def update(self, wanted: Dict):
+        with self.condition:
+            self.wanted = dict(wanted)
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.wanted = {}
+            self.condition.notify_all()
+
+    def next_key(self):
+        """Most wanted key nobody is decoding yet, or None"""
+        candidates = [key for key in self.wanted if key not in self.active]
+        return min(candidates, key=self.wanted.get) if candidates else None
+
+    def work(self):
+        while True:
+            with self.condition:
+                key = self.next_key()
+                while key is None and not self.closed:
+                    self.condition.wait()
+                    key = self.next_key()
+                if self.closed:
+                    return
+                self.active.add(key)
+
+            try:
+                image = self.decode(key)
+            except Exception as e:
+                logging.debug(f"No thumbnail for {key}: {e}")
+                image = None
+
+            with self.condition:
+                self.active.discard(key)
+                self.wanted.pop(key, None)
+                if self.closed:
+                    return
+            self.deliver(key, image)
+
+class ScaledBackgroundCache:
+    """Downscaled backgrounds cached per (source hash, target size)"""
+
+    def __init__(self, cache_dir: str = None, pixel_budget: int = MAX_PIXELS):
+        self.cache_dir = cache_dir or os.path.dirname(cache_path("scaled", ""))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.pixel_budget = pixel_budget
+
+    def scaled(self, data: bytes, max_size: Tuple[int, int]) -> bytes:
+        """PNG bytes of data fitted into max_size, or data itself when it already fits"""
+        digest = hashlib.sha1(data).hexdigest()
+        cached_path = os.path.join(self.cache_dir, f"{digest}-{max_size[0]}x{max_size[1]}.png")
+        if os.path.exists(cached_path):
+            with open(cached_path, "rb") as file:
+                return file.read()
+
+        img = open_bounded(data, self.pixel_budget)
+        if fit_size(img.size, max_size) == img.size:
+            return data
+
+        output = io.BytesIO()
+        downscale(img, max_size).save(output, "PNG")
+        result = output.getvalue()
+
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(result)
+        os.replace(temp_path, cached_path)
+        logging.info(f"Downscaled background {img.size[0]}x{img.size[1]} to fit {max_size[0]}x{max_size[1]}")
+        return result
+
+def same_pixels(a: Image.Image, b: Image.Image) -> bool:
+    """True when two images decode to identical RGBA pixels"""
+    if a.size != b.size:
+        return False
+    return ImageChops.difference(a.convert("RGBA"), b.convert("RGBA")).getbbox() is None
+
+def reduce_mode(img: Image.Image) -> Image.Image:
+    """Cheapest lossless pixel format for an image"""
+    if img.mode not in ("RGB", "RGBA", "LA", "L", "P"):
+        return img
+
+    if img.mode == "P":
+        return img
+    if img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema() == (255, 255):
+        img = img.convert("RGB" if img.mode == "RGBA" else "L")
+
+    candidate = None
+    if img.mode in ("RGB", "RGBA") and img.getcolors(256) is not None:
+        method = Image.Quantize.FASTOCTREE if img.mode == "RGBA" else Image.Quantize.MEDIANCUT
+        candidate = img.quantize(colors=256, method=method, dither=Image.Dither.NONE)
+    elif img.mode == "RGB":
+        r, g, b = img.split()
+        if r.tobytes() == g.tobytes() == b.tobytes():
+            candidate = r
+
+    # Only keep the smaller format when it round-trips exactly
+    if candidate is not None and same_pixels(img, candidate):
+        return candidate
+    return img
+
+def optimize_png(data: bytes, pixel_budget: int = MAX_PIXELS) -> bytes:
+    """Losslessly recompress a PNG, returning the original bytes when nothing smaller is found.
+
+    Re-encoding drops ancillary chunks (text, time, EXIF, ICC), the pixel
+    format is reduced when that is lossless, and each zlib strategy is
+    tried at the highest compression level.
+    """
+    img = open_bounded(data, pixel_budget)
+    img.load()
+    reduced_img = reduce_mode(img)
+
+    best = data
+    for strategy in ZLIB_STRATEGIES:
+        output = io.BytesIO()
+        options = {"compress_level": 9, "compress_type": strategy}
+        if strategy == -1:
+            options["optimize"] = True
+        reduced_img.save(output, "PNG", **options)
+        if output.tell() < len(best):
+            best = output.getvalue()
+
+    if best is not data and not same_pixels(img, Image.open(io.BytesIO(best))):
+        logging.warning("PNG optimization changed pixels, keeping the original")
+        return data
+    return best
+
+def _optimize_job(data: bytes) -> bytes:
+    """Worker entry point for PngOptimizer"""
+    return optimize_png(data)
+
+class PngOptimizer:
+    """Parallel lossless PNG optimizer with results cached by input hash"""
+
+    def __init__(self, cache_dir: str = None, max_workers: int = None):
+        self.cache_dir = cache_dir or os.path.dirname(cache_path("optimized", ""))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_workers = max_workers
+
+    def _cache_file(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.png")
+
+    def optimize_many(self, blobs: List[bytes]) -> List[bytes]:
+        """Optimized versions of several PNGs, only computing the uncached ones"""
+        results = [None] * len(blobs)
+        pending = []
+        for index, data in enumerate(blobs):
+            digest = hashlib.sha1(data).hexdigest()
+            cache_file = self._cache_file(digest)
+            if os.path.exists(cache_file):
+                with open(cache_file, "rb") as file:
+                    results[index] = file.read()
+            else:
+                pending.append((index, digest))
+
+        if pending:
+            with process_pool(self.max_workers or len(pending)) as executor:
+                futures = [(index, digest, executor.submit(_optimize_job, blobs[index]))
+                           for index, digest in pending]
+                for index, digest, future in futures:
+                    try:
+                        optimized = future.result()
+                    except Exception as e:
+                        logging.warning(f"Could not optimize PNG: {e}")
+                        results[index] = blobs[index]
+                        continue
+                    results[index] = optimized
+                    temp_path = f"{self._cache_file(digest)}.{os.getpid()}.tmp"
+                    with open(temp_path, "wb") as file:
+                        file.write(optimized)
+                    os.replace(temp_path, self._cache_file(digest))
+        return results
@@ -0,0 +1,209 @@
+"""Priority scheduler for theme directory I/O.
+
+Jobs run in lanes: interactive work (previews, imports, exports, listing
+the themes the user asked for) goes ahead of prefetching (metadata and
+thumbnails), which goes ahead of indexing (validation and catalog warmups).
+Each lane has its own concurrency limit and reads and writes are charged
+against a shared bandwidth budget, so a full rescan cannot make a preview
+wait.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future
+from typing import Callable, List, Optional
+
+# Lanes in priority order
+INTERACTIVE, PREFETCH, INDEXING = 0, 1, 2
+LANE_NAMES = ["interactive", "prefetch", "indexing"]
+
+# Jobs running at once per lane
+LANE_LIMITS = [8, 4, 2]
+
+# Disk bandwidth shared by all lanes in bytes per second, 0 for no cap
+DEFAULT_BANDWIDTH = 64 * 1024 * 1024
+
+# Bytes charged for listing a directory, which costs a round trip on network shares
+DIRECTORY_COST = 4096
+
+_context = threading.local()
+
+class IOCancelled(CancelledError):
+    """Raised inside a job whose request was superseded"""
+
+class IOJob:
+    def __init__(self, scheduler: "IOScheduler", lane: int, func: Callable, args: tuple, tag):
+        self.scheduler = scheduler
+        self.lane = lane
+        self.func = func
+        self.args = args
+        self.tag = tag
+        self.future = Future()
+        self.cancelled = False
+
+class IOScheduler:
+    """Runs jobs by lane priority with per-lane limits and a bandwidth cap.
+
+    Interactive jobs are charged against the bandwidth budget but never wait
+    for it; the lower lanes wait until the budget allows their next read, and
+    a waiting lane always yields to the lanes above it. Jobs submitted with
+    a tag can be cancelled together: queued ones are dropped and running
+    ones raise IOCancelled at their next read or write.
+    """
+
+    def __init__(self, bandwidth: int = DEFAULT_BANDWIDTH, lane_limits: List[int] = None):
+        self.lane_limits = list(lane_limits or LANE_LIMITS)
+        self.bandwidth = bandwidth
+        self.burst = max(bandwidth // 4, 1024 * 1024)
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.condition = threading.Condition()
+        self.queues = [deque() for _ in self.lane_limits]
+        self.active = [0] * len(self.lane_limits)
+        self.throttled = [0] * len(self.lane_limits)
+        self.tagged = {}
+        self.closed = False
+        for lane, limit in enumerate(self.lane_limits):
+            for i in range(limit):
+                threading.Thread(target=self.work, args=(lane,), name=f"io-{LANE_NAMES[lane]}-{i}",
+                                 daemon=True).start()
+
+    def submit(self, lane: int, func: Callable, *args, tag=None) -> Future:
+        """Queue func(*args) in a lane, returning its future"""
+        job = IOJob(self, lane, func, args, tag)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("I/O scheduler is closed")
+            self.queues[lane].append(job)
+            if tag is not None:
+                self.tagged.setdefault(tag, set()).add(job)
+            self.condition.notify_all()
+        return job.future
+
+    def run(self, lane: int, func: Callable, *args, tag=None):
+        """Run func(*args) in a lane and wait for its result.
+
+        Called from inside a job, func runs right away as part of that job, so
+        a job never waits for a lane slot it may itself be holding.
+        """
+        if current_job() is not None:
+            return func(*args)
+        return self.submit(lane, func, *args, tag=tag).result()
+
+    def cancel(self, tag) -> int:
+        """Cancel the queued and running jobs submitted with tag, returning how many"""
+        with self.condition:
+            jobs = self.tagged.pop(tag, set())
+            for job in jobs:
+                if not job.future.cancel():
+                    job.cancelled = True
+            self.condition.notify_all()
+        return len(jobs)
+
+    def close(self):
+        """Stop the workers, cancelling everything still queued"""
+        with self.condition:
+            self.closed = True
+            for queue in self.queues:
+                for job in queue:
+                    job.future.cancel()
+                queue.clear()
+            for jobs in self.tagged.values():
+                for job in jobs:
+                    job.cancelled = True
+            self.condition.notify_all()
+
+    def next_job(self, lane: int) -> Optional[IOJob]:
+        queue = self.queues[lane]
+        while queue and queue[0].future.cancelled():
+            queue.popleft()
+        return queue.popleft() if queue else None
+
+    def work(self, lane: int):
+        """Worker thread of one lane, a lane has as many workers as its limit"""
+        while True:
+            with self.condition:
+                job = self.next_job(lane)
+                while job is None and not self.closed:
+                    self.condition.wait()
+                    job = self.next_job(lane)
+                if self.closed:
+                    return
+                self.active[lane] += 1
+
+            if job.future.set_running_or_notify_cancel():
+                _context.job = job
+                try:
+                    result = job.func(*job.args)
+                except BaseException as e:
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+                finally:
+                    _context.job = None
+
+            with self.condition:
+                self.active[lane] -= 1
+                if job.tag is not None and job.tag in self.tagged:
+                    self.tagged[job.tag].discard(job)
+                    if not self.tagged[job.tag]:
+                        del self.tagged[job.tag]
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.bandwidth)
+        self.refilled_at = now
+
+    def throttle(self, job: IOJob, nbytes: int):
+        """Take nbytes from the bandwidth budget for a job, waiting in the lower lanes"""
+        with self.condition:
+            if job.cancelled:
+                raise IOCancelled()
+            if not self.bandwidth:
+                return
+            self.refill()
+            if job.lane == INTERACTIVE:
+                self.tokens -= nbytes
+                return
+
+            # Reads larger than the burst go through once the bucket is full
+            needed = min(nbytes, self.burst)
+            self.throttled[job.lane] += 1
+            try:
+                while self.tokens < needed or any(self.throttled[:job.lane]):
+                    self.condition.wait(max(needed - self.tokens, 0) / self.bandwidth or 0.01)
+                    if job.cancelled:
+                        raise IOCancelled()
+                    self.refill()
+                self.tokens -= nbytes
+            finally:
+                self.throttled[job.lane] -= 1
+                self.condition.notify_all()
+
+def current_job() -> Optional[IOJob]:
+    """The scheduler job running on this thread, if any"""
+    return getattr(_context, "job", None)
+
+def charge(nbytes: int):
+    """Account for nbytes of disk I/O about to be done.
+
+    Inside a scheduler job this applies the bandwidth cap and raises
+    IOCancelled when the job was cancelled; outside of one it does nothing,
+    so the command line tools are not throttled.
+    """
+    job = current_job()
+    if job is not None:
+        job.scheduler.throttle(job, nbytes)
+
+def read_file(path: str) -> bytes:
+    """Read a whole file, charging its size first"""
+    charge(os.path.getsize(path))
+    with open(path, "rb") as file:
+        return file.read()
+
+def write_file(path: str, data: bytes):
+    """Write a whole file, charging its size first"""
+    charge(len(data))
+    with open(path, "wb") as file:
+        file.write(data)
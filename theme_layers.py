@@ -0,0 +1,178 @@
+"""Layered themes: a config.txt may name a parent theme whose colors and assets it overrides"""
+import os
+import io
+import hashlib
+import zipfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from theme_catalog import (CONFIG_FILE, THEME_ASSETS, ThemeSource, format_theme_config, parse_theme_config,
+                           parse_theme_parent, png_resolution, theme_fingerprint)
+
+# Longest parent chain followed before giving up
+MAX_LAYER_DEPTH = 32
+
+class ThemeLayerError(Exception):
+    """Raised for a missing or out of tree parent theme, or an inheritance cycle"""
+
+class ResolvedTheme:
+    """A theme merged with its parents.
+
+    assets maps each asset name to the layer providing it, so the bytes are
+    only read from the layer that wins, and sizes holds their uncompressed
+    sizes.
+    """
+
+    def __init__(self, chain: List[str], fingerprint: Tuple, colors: Dict[str, int], assets: Dict[str, str],
+                 sizes: Dict[str, int]):
+        self.chain = chain
+        self.fingerprint = fingerprint
+        self.colors = colors
+        self.assets = assets
+        self.sizes = sizes
+
+    @property
+    def name(self) -> str:
+        return self.chain[0]
+
+    @property
+    def parent(self) -> Optional[str]:
+        return self.chain[1] if len(self.chain) > 1 else None
+
+class ThemeResolver:
+    """Resolves parent chains with memoized layers and merges.
+
+    Each layer's config.txt is read once and kept until its stat fingerprint
+    changes. Merged results are memoized per theme and keyed by the
+    fingerprints of the whole chain, so sibling variants share the merge of
+    their common ancestors and an edited ancestor invalidates every theme
+    built on it.
+    """
+
+    def __init__(self, theme_path: str):
+        self.theme_path = theme_path
+        self.lock = threading.Lock()
+        self.layers = {}
+        self.resolved = {}
+
+    def layer(self, theme_name: str) -> Tuple[Tuple, Dict]:
+        """(fingerprint, own colors, parent and asset sizes) of one theme, without its parents"""
+        fingerprint = theme_fingerprint(self.theme_path, theme_name)
+        with self.lock:
+            cached = self.layers.get(theme_name)
+        if cached is not None and cached[0] == fingerprint:
+            return cached
+
+        with ThemeSource(self.theme_path, theme_name) as source:
+            text = source.read_bytes(CONFIG_FILE).decode("utf-8")
+            layer = {
+                "colors": parse_theme_config(text),
+                "parent": parse_theme_parent(text),
+                "assets": source.asset_sizes(),
+            }
+        entry = (fingerprint, layer)
+        with self.lock:
+            self.layers[theme_name] = entry
+        return entry
+
+    def find_parent(self, parent: str) -> str:
+        """Theme name of a declared parent, accepting zips named without .zip.
+
+        Parents must live in the theme directory, a synced theme must not pull
+        files from anywhere else into the game.
+        """
+        root = os.path.realpath(self.theme_path)
+        for candidate in (parent, f"{parent}.zip"):
+            full_path = os.path.realpath(os.path.join(self.theme_path, candidate))
+            if full_path == root or os.path.commonpath([root, full_path]) != root:
+                raise ThemeLayerError(f"Parent theme outside the theme directory: {parent}")
+            if os.path.exists(full_path):
+                return os.path.normpath(candidate).replace(os.sep, "/")
+        raise ThemeLayerError(f"Parent theme not found: {parent}")
+
+    def resolve(self, theme_name: str) -> ResolvedTheme:
+        """Merge a theme over its parents, the theme itself winning"""
+        chain, fingerprints, layers = [], [], []
+        name = theme_name
+        while name is not None:
+            if name in chain:
+                raise ThemeLayerError(f"Theme inheritance cycle: {' -> '.join(chain + [name])}")
+            if len(chain) >= MAX_LAYER_DEPTH:
+                raise ThemeLayerError(f"More than {MAX_LAYER_DEPTH} parent themes above {theme_name}")
+            try:
+                fingerprint, layer = self.layer(name)
+            except OSError:
+                raise ThemeLayerError(f"Theme not found: {name}")
+            chain.append(name)
+            fingerprints.append(fingerprint)
+            layers.append(layer)
+            name = self.find_parent(layer["parent"]) if layer["parent"] else None
+
+        # Merge from the root down, reusing the memoized merge of every unchanged ancestor
+        merged = None
+        for index in range(len(chain) - 1, -1, -1):
+            key = tuple(fingerprints[index:])
+            with self.lock:
+                cached = self.resolved.get(chain[index])
+            if cached is not None and cached.fingerprint == key:
+                merged = cached
+                continue
+
+            colors = dict(merged.colors) if merged else {}
+            colors.update(layers[index]["colors"])
+            assets = dict(merged.assets) if merged else {}
+            assets.update((asset_name, chain[index]) for asset_name in layers[index]["assets"])
+            sizes = dict(merged.sizes) if merged else {}
+            sizes.update(layers[index]["assets"])
+            merged = ResolvedTheme(chain[index:], key, colors, assets, sizes)
+            with self.lock:
+                self.resolved[chain[index]] = merged
+        return merged
+
+    def read_assets(self, resolved: ResolvedTheme, asset_names: Optional[List[str]] = None) -> Dict[str, bytes]:
+        """Asset bytes of a resolved theme, each read once from the layer providing it"""
+        by_layer = {}
+        for asset_name in asset_names or THEME_ASSETS:
+            if asset_name in resolved.assets:
+                by_layer.setdefault(resolved.assets[asset_name], []).append(asset_name)
+
+        assets = {}
+        for layer_name, names in by_layer.items():
+            with ThemeSource(self.theme_path, layer_name) as source:
+                for asset_name in names:
+                    assets[asset_name] = source.read_bytes(asset_name)
+        return {asset_name: assets[asset_name] for asset_name in THEME_ASSETS if assets.get(asset_name) is not None}
+
+    def background_resolution(self, resolved: ResolvedTheme) -> Optional[Tuple[int, int]]:
+        """Size of the background a resolved theme ends up with, from its IHDR chunk"""
+        layer_name = resolved.assets.get("background.png")
+        if layer_name is None:
+            return None
+        with ThemeSource(self.theme_path, layer_name) as source:
+            return png_resolution(source.read_head("background.png", 24))
+
+    def content_hash(self, resolved: ResolvedTheme) -> str:
+        """Hash of the merged colors and every asset a resolved theme ends up with"""
+        assets = self.read_assets(resolved)
+        digest = hashlib.sha1()
+        digest.update(repr(sorted(resolved.colors.items())).encode("utf-8"))
+        for asset_name in THEME_ASSETS:
+            data = assets.get(asset_name)
+            digest.update(asset_name.encode("utf-8"))
+            digest.update(b"\0" if data is None else hashlib.sha1(data).digest())
+        return digest.hexdigest()
+
+    def to_zip_bytes(self, resolved: ResolvedTheme) -> bytes:
+        """Pack a resolved theme into a standalone zip that needs none of its parents"""
+        files = {CONFIG_FILE: format_theme_config(resolved.colors.get("primary_color", 0),
+                                                  resolved.colors.get("background_color", 0)).encode("utf-8")}
+        files.update(self.read_assets(resolved))
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_name in [CONFIG_FILE] + THEME_ASSETS:
+                if file_name not in files:
+                    continue
+                info = zipfile.ZipInfo(file_name, date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, files[file_name])
+        return buffer.getvalue()
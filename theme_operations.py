@@ -0,0 +1,107 @@
+"""Theme import and export shared by the GUI and the daemon"""
+import os
+import json
+import shutil
+import zipfile
+from typing import Dict, Tuple
+
+from theme_catalog import CONFIG_FILE, THEME_ASSETS, format_theme_config
+from theme_images import PngOptimizer, ScaledBackgroundCache
+from theme_io import charge, read_file, write_file
+from theme_layers import ThemeResolver
+
+def read_theme(theme_path: str, theme_name: str,
+               resolver: ThemeResolver = None) -> Tuple[Dict[str, int], Dict[str, bytes]]:
+    """Colors and asset bytes of a theme merged over its parents, read without extracting zips"""
+    resolver = resolver or ThemeResolver(theme_path)
+    resolved = resolver.resolve(theme_name)
+    return dict(resolved.colors), resolver.read_assets(resolved)
+
+def apply_theme(config_path: str, colors: Dict[str, int], assets: Dict[str, bytes],
+                max_background_size: Tuple[int, int] = None, scaled_backgrounds: ScaledBackgroundCache = None):
+    """Write theme colors into bbs.json and copy its assets into the game textures"""
+    bbs_config_path = os.path.join(config_path, "settings", "bbs.json")
+    textures_path = os.path.join(config_path, "assets", "textures")
+    os.makedirs(textures_path, exist_ok=True)
+
+    # Update BBS configuration
+    config = json.loads(read_file(bbs_config_path))
+
+    if "appearance" in config and "primary_color" in colors:
+        config["appearance"]["primary_color"] = colors["primary_color"]
+    if "background" in config and "background_color" in colors:
+        config["background"]["color"] = colors["background_color"]
+
+    write_file(bbs_config_path, json.dumps(config, indent=4).encode("utf-8"))
+
+    # Copy assets
+    for asset_name, data in assets.items():
+        if asset_name == "background.png" and max_background_size:
+            data = (scaled_backgrounds or ScaledBackgroundCache()).scaled(data, max_background_size)
+        write_file(os.path.join(textures_path, asset_name), data)
+
+def import_theme(config_path: str, theme_name: str, max_background_size: Tuple[int, int] = None,
+                 scaled_backgrounds: ScaledBackgroundCache = None, resolver: ThemeResolver = None):
+    """Apply a theme from the theme directory to the game config.
+
+    A layered theme is merged with its parents first, so bbs.json is written
+    once and each asset copied once whatever the depth of the chain.
+    """
+    colors, assets = read_theme(os.path.join(config_path, "theme"), theme_name, resolver)
+    apply_theme(config_path, colors, assets, max_background_size, scaled_backgrounds)
+
+def write_theme(theme_path: str, theme_name: str, primary_color: int, background_color: int,
+                assets: Dict[str, bytes], export_type: str = "zip") -> str:
+    """Write a theme folder or zip in the export format, returning its path"""
+    theme_dir = os.path.join(theme_path, theme_name)
+    zip_path = os.path.join(theme_path, f"{theme_name}.zip")
+    target_path = zip_path if export_type == "zip" else theme_dir
+    # The folder export replaces the target recursively, never let it point elsewhere
+    if (theme_name in ("", ".", "..")
+            or os.path.dirname(os.path.realpath(target_path)) != os.path.realpath(theme_path)):
+        raise ValueError(f"Invalid theme name: {theme_name}")
+    files = [(CONFIG_FILE, format_theme_config(primary_color, background_color).encode("utf-8"))]
+    files += [(asset_name, assets[asset_name]) for asset_name in THEME_ASSETS if asset_name in assets]
+
+    if export_type == "zip":
+        temp_path = f"{zip_path}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_name, data in files:
+                charge(len(data))
+                # PNG data is already deflated, storing it saves recompressing for nothing
+                compress_type = zipfile.ZIP_STORED if file_name.endswith(".png") else zipfile.ZIP_DEFLATED
+                archive.writestr(file_name, data, compress_type=compress_type)
+        os.replace(temp_path, zip_path)
+        return zip_path
+
+    if os.path.exists(theme_dir):
+        shutil.rmtree(theme_dir)
+    os.makedirs(theme_dir)
+    try:
+        for file_name, data in files:
+            write_file(os.path.join(theme_dir, file_name), data)
+    except Exception:
+        shutil.rmtree(theme_dir)
+        raise
+    return theme_dir
+
+def export_theme(config_path: str, theme_name: str, export_type: str = "zip",
+                 optimize_assets: bool = False, png_optimizer: PngOptimizer = None) -> str:
+    """Save the current game colors and textures as a theme folder or zip"""
+    # Read BBS configuration
+    bbs_config_path = os.path.join(config_path, "settings", "bbs.json")
+    config = json.loads(read_file(bbs_config_path))
+
+    # Collect assets
+    textures_path = os.path.join(config_path, "assets", "textures")
+    assets = {}
+    for asset_name in THEME_ASSETS:
+        asset_path = os.path.join(textures_path, asset_name)
+        if os.path.exists(asset_path):
+            assets[asset_name] = read_file(asset_path)
+    if optimize_assets and assets:
+        optimized = (png_optimizer or PngOptimizer()).optimize_many(list(assets.values()))
+        assets = dict(zip(assets, optimized))
+
+    return write_theme(os.path.join(config_path, "theme"), theme_name, config["appearance"]["primary_color"],
+                       config["background"]["color"], assets, export_type)
@@ -0,0 +1,229 @@
+"""Palette extraction that suggests theme colors from a background image"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from theme_catalog import ThemeSource, cache_path, list_themes
+from theme_images import expanded, open_bounded
+
+SAMPLE_SIZE = 96
+CLUSTERS = 6
+ITERATIONS = 12
+MIN_SHARE = 0.02
+
+def to_argb(rgb, alpha: int = 0xFF) -> int:
+    """Signed 32-bit ARGB integer as stored in config.txt and bbs.json"""
+    r, g, b = (int(round(c)) for c in rgb)
+    value = (alpha << 24) | (r << 16) | (g << 8) | b
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+def relative_luminance(rgb: np.ndarray) -> np.ndarray:
+    """WCAG relative luminance of sRGB colors in 0-255"""
+    c = rgb / 255.0
+    linear = np.where(c <= 0.03928, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+def contrast_ratio(lum_a: np.ndarray, lum_b: np.ndarray) -> np.ndarray:
+    """WCAG contrast ratio between luminance values"""
+    high = np.maximum(lum_a, lum_b)
+    low = np.minimum(lum_a, lum_b)
+    return (high + 0.05) / (low + 0.05)
+
+def sample_pixels(img: Image.Image) -> np.ndarray:
+    """Downsample an image to at most SAMPLE_SIZE pixels per side as an (N, 3) array"""
+    img.draft("RGB", (SAMPLE_SIZE, SAMPLE_SIZE))
+    # Converted first, reduce() refuses palette, 1 bit and 16 bit images
+    img = expanded(img)
+    if img.mode == "L":
+        img = img.convert("RGB")
+    factor = max(1, min(img.size) // SAMPLE_SIZE)
+    if factor > 1:
+        img = img.reduce(factor)
+    if img.mode == "RGBA":
+        rgba = np.asarray(img, dtype=np.float32).reshape(-1, 4)
+        rgba = rgba[rgba[:, 3] > 0]
+        return rgba[:, :3] if len(rgba) else np.zeros((1, 3), dtype=np.float32)
+    return np.asarray(img, dtype=np.float32).reshape(-1, 3)
+
+def kmeans(pixels: np.ndarray, k: int = CLUSTERS, iterations: int = ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized k-means returning (centers, counts) sorted by count"""
+    k = min(k, len(np.unique(pixels, axis=0)))
+
+    # Deterministic start: spread the seeds over the luminance order
+    order = np.argsort(pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32))
+    centers = pixels[order[np.linspace(0, len(order) - 1, k).astype(int)]].copy()
+
+    labels = np.zeros(len(pixels), dtype=np.int64)
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if _ and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+
+    counts = np.bincount(labels, minlength=k)
+    keep = counts > 0
+    centers, counts = centers[keep], counts[keep]
+    ranking = np.argsort(-counts)
+    return centers[ranking], counts[ranking]
+
+def extract_palette(img: Image.Image) -> Dict:
+    """Cluster an image and rank the colors by contrast against it"""
+    pixels = sample_pixels(img)
+    centers, counts = kmeans(pixels)
+    shares = counts / counts.sum()
+
+    luminance = relative_luminance(centers)
+    image_luminance = float(shares @ luminance)
+    contrast = contrast_ratio(luminance, np.full_like(luminance, image_luminance))
+
+    palette = [{"rgb": [int(round(c)) for c in center], "share": round(float(share), 4),
+                "contrast": round(float(ratio), 3)}
+               for center, share, ratio in zip(centers, shares, contrast)]
+
+    # The dominant cluster backs the UI, the most contrasting visible cluster is the accent
+    background = palette[0]
+    candidates = [p for p in palette[1:] if p["share"] >= MIN_SHARE] or palette
+    primary = max(candidates, key=lambda p: p["contrast"])
+    if primary["contrast"] < 3.0:
+        # Nothing in the image stands out enough, fall back to black or white text
+        primary = {"rgb": [255, 255, 255] if image_luminance < 0.18 else [0, 0, 0]}
+
+    return {
+        "palette": sorted(palette, key=lambda p: -p["contrast"]),
+        "primary_rgb": primary["rgb"],
+        "background_rgb": background["rgb"],
+    }
+
+def analyze_bytes(data: bytes) -> Dict:
+    """Palette of an encoded image"""
+    return extract_palette(open_bounded(data))
+
+_known_hashes = frozenset()
+
+def _init_worker(known: frozenset):
+    global _known_hashes
+    _known_hashes = known
+
+def _analyze_job(theme_path: str, theme_name: str) -> Tuple[str, Optional[str], Optional[Dict]]:
+    """Worker entry point: hash the background and cluster it unless already cached"""
+    with ThemeSource(theme_path, theme_name) as source:
+        data = source.read_bytes("background.png")
+    if data is None:
+        return theme_name, None, None
+
+    digest = hashlib.sha1(data).hexdigest()
+    if digest in _known_hashes:
+        return theme_name, digest, None
+    return theme_name, digest, analyze_bytes(data)
+
+class PaletteAnalyzer:
+    """Suggests primary and background colors, caching results per image hash"""
+
+    def __init__(self, cache_file: str = None):
+        if cache_file is None:
+            cache_file = cache_path("palette.json")
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.cache = self.load_cache()
+
+    def load_cache(self) -> Dict:
+        try:
+            with open(self.cache_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        with self.lock:
+            data = dict(self.cache)
+        temp_path = self.cache_file + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_file)
+
+    def analyze(self, data: bytes, img: Image.Image = None) -> Dict:
+        """Palette of an encoded image, served from the cache when possible.
+
+        img is the image already decoded from data, possibly reduced; it is
+        clustered instead of decoding data a second time.
+        """
+        digest = hashlib.sha1(data).hexdigest()
+        with self.lock:
+            cached = self.cache.get(digest)
+        if cached is not None:
+            return cached
+
+        result = extract_palette(img) if img is not None else analyze_bytes(data)
+        with self.lock:
+            self.cache[digest] = result
+        return result
+
+    def analyze_file(self, image_path: str) -> Dict:
+        with open(image_path, "rb") as file:
+            return self.analyze(file.read())
+
+    def suggest(self, data: bytes, primary_alpha: int = 0xFF, background_alpha: int = 0xFF,
+                img: Image.Image = None) -> Dict[str, int]:
+        """Suggested config.txt colors for an encoded background, see analyze() for img"""
+        result = self.analyze(data, img)
+        return {
+            "primary_color": to_argb(result["primary_rgb"], primary_alpha),
+            "background_color": to_argb(result["background_rgb"], background_alpha),
+        }
+
+    def analyze_catalog(self, theme_path: str, max_workers: int = None) -> Dict[str, Dict]:
+        """Analyze every theme background in a process pool"""
+        with self.lock:
+            known = frozenset(self.cache)
+
+        results = {}
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(known,)) as executor:
+            futures = [executor.submit(_analyze_job, theme_path, name)
+                       for name in list_themes(theme_path)]
+            for future in futures:
+                try:
+                    theme_name, digest, result = future.result()
+                except Exception as e:
+                    logging.warning(f"Palette analysis failed: {e}")
+                    continue
+                if digest is None:
+                    continue
+                with self.lock:
+                    if result is not None:
+                        self.cache[digest] = result
+                    results[theme_name] = self.cache[digest]
+
+        self.save_cache()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest theme colors from background images")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    analyzer = PaletteAnalyzer()
+    results = analyzer.analyze_catalog(os.path.join(args.config, "theme"), args.workers)
+    for theme_name, result in sorted(results.items()):
+        print(f'{theme_name}: "primary_color": {to_argb(result["primary_rgb"])}, '
+              f'"background_color": {to_argb(result["background_rgb"])}')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,562 @@
+"""Theme repository HTTP service and pooled client"""
+import os
+import io
+import re
+import json
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+from theme_catalog import ThemeCatalog, ThemeSource, cache_path, list_themes, theme_stem
+from theme_layers import ThemeResolver
+
+DEFAULT_PORT = 8765
+THUMBNAIL_SIZE = (256, 128)
+CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def make_etag(*parts) -> str:
+    """Strong ETag derived from the given values"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single byte range, returning (start, end) inclusive.
+
+    Returns None for malformed or multi-range headers (served as a full
+    response) and raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+class ThemeRepository:
+    """Catalog, archive and thumbnail store backing the HTTP service"""
+
+    def __init__(self, config_path: str):
+        self.theme_path = os.path.join(config_path, "theme")
+        self.resolver = ThemeResolver(self.theme_path)
+        self.catalog = ThemeCatalog(self.theme_path, self.resolver)
+        self.lock = threading.Lock()
+        self.archives = {}
+        self.thumbnails = {}
+        self._catalog_body = (None, None, None)
+
+    def catalog_json(self) -> Tuple[bytes, str]:
+        """Serialized catalog and its ETag"""
+        with self.lock:
+            records = self.catalog.refresh()
+            themes = []
+            for record in records:
+                entry = dict(record)
+                fingerprint = self.catalog.entries[record["name"]][0]
+                entry["etag"] = make_etag(record["name"], fingerprint)
+                # Names of themes in categories contain "/", escape it to keep one path segment
+                entry["archive"] = f"/themes/{quote(record['name'], safe='')}/archive"
+                entry["thumbnail"] = f"/themes/{quote(record['name'], safe='')}/thumbnail"
+                themes.append(entry)
+
+            key = tuple((t["name"], t["etag"]) for t in themes)
+            if self._catalog_body[0] != key:
+                body = json.dumps({"themes": themes}, indent=2).encode("utf-8")
+                self._catalog_body = (key, body, make_etag(key))
+            return self._catalog_body[1], self._catalog_body[2]
+
+    def _check_name(self, theme_name: str) -> bool:
+        with self.lock:
+            if theme_name in self.catalog.entries:
+                return True
+        return theme_name in list_themes(self.theme_path)
+
+    def archive(self, theme_name: str) -> Optional[Tuple[object, int, str]]:
+        """Archive of a theme as (file path or bytes, size, ETag).
+
+        Layered themes are served merged with their parents, so the installed
+        zip works without them.
+        """
+        if not self._check_name(theme_name):
+            return None
+
+        resolved = self.resolver.resolve(theme_name)
+        fingerprint = resolved.fingerprint
+        etag = make_etag(theme_name, fingerprint)
+        full_path = os.path.join(self.theme_path, theme_name)
+        if resolved.parent is None and not os.path.isdir(full_path):
+            return full_path, os.path.getsize(full_path), etag
+
+        # Folder and layered themes are packed once per fingerprint and served from memory
+        with self.lock:
+            cached = self.archives.get(theme_name)
+            if cached is None or cached[0] != fingerprint:
+                if resolved.parent is None:
+                    with ThemeSource(self.theme_path, theme_name) as source:
+                        cached = (fingerprint, source.to_zip_bytes())
+                else:
+                    cached = (fingerprint, self.resolver.to_zip_bytes(resolved))
+                self.archives[theme_name] = cached
+        data = cached[1]
+        return data, len(data), etag
+
+    def thumbnail(self, theme_name: str) -> Optional[Tuple[bytes, str]]:
+        """PNG thumbnail of the background the theme ends up with and its ETag"""
+        if not self._check_name(theme_name):
+            return None
+
+        resolved = self.resolver.resolve(theme_name)
+        fingerprint = resolved.fingerprint
+        with self.lock:
+            cached = self.thumbnails.get(theme_name)
+        if cached is None or cached[0] != fingerprint:
+            from PIL import Image
+
+            data = self.resolver.read_assets(resolved, ["background.png"]).get("background.png")
+            if data is None:
+                return None
+            img = Image.open(io.BytesIO(data))
+            img.draft("RGB", THUMBNAIL_SIZE)
+            img = img.convert("RGBA")
+            img.thumbnail(THUMBNAIL_SIZE)
+            output = io.BytesIO()
+            img.save(output, "PNG")
+            cached = (fingerprint, output.getvalue())
+            with self.lock:
+                self.thumbnails[theme_name] = cached
+        return cached[1], make_etag(theme_name, fingerprint, "thumbnail")
+
+class ThemeRepositoryHandler(BaseHTTPRequestHandler):
+    """Serves the catalog, archives and thumbnails with conditional requests"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "BBSThemeRepository/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body: bool):
+        repository = self.server.repository
+        path = urlsplit(self.path).path
+
+        try:
+            if path == "/api/themes":
+                body, etag = repository.catalog_json()
+                self.send_payload(body, len(body), etag, "application/json", send_body, allow_range=False)
+                return
+
+            match = re.match(r"^/themes/([^/]+)/(archive|thumbnail)$", path)
+            if not match:
+                self.send_error(404, "Not Found")
+                return
+
+            theme_name = unquote(match.group(1))
+            if match.group(2) == "archive":
+                result = repository.archive(theme_name)
+                if result is None:
+                    self.send_error(404, "Theme not found")
+                    return
+                payload, size, etag = result
+                self.send_payload(payload, size, etag, "application/zip", send_body)
+            else:
+                result = repository.thumbnail(theme_name)
+                if result is None:
+                    self.send_error(404, "Thumbnail not found")
+                    return
+                body, etag = result
+                self.send_payload(body, len(body), etag, "image/png", send_body)
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            logging.error(f"Repository error for {path}: {e}")
+            self.send_error(500, "Internal Server Error")
+
+    def etag_matches(self, header: Optional[str], etag: str) -> bool:
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    def send_payload(self, payload, size: int, etag: str, content_type: str,
+                     send_body: bool, allow_range: bool = True):
+        """Send a file path or bytes honouring If-None-Match and Range"""
+        if self.etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if allow_range and range_header and size > 0 and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range:
+                start, end = byte_range
+                status = 206
+
+        length = end - start + 1 if size else 0
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if allow_range:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if not send_body or length == 0:
+            return
+
+        if isinstance(payload, bytes):
+            self.wfile.write(payload[start:end + 1])
+            return
+
+        with open(payload, "rb") as file:
+            file.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+class ThemeRepositoryServer(ThreadingHTTPServer):
+    """Threaded HTTP server sharing one ThemeRepository"""
+
+    daemon_threads = True
+
+    def __init__(self, config_path: str, host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+        self.repository = ThemeRepository(config_path)
+        super().__init__((host, port), ThemeRepositoryHandler)
+
+class ConnectionPool:
+    """Pool of keep-alive connections to a single repository host"""
+
+    RETRYABLE = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                 BrokenPipeError, ConnectionResetError)
+
+    def __init__(self, base_url: str, size: int = 4, timeout: float = 30):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Reuse an idle connection or open a new one"""
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def release(self, conn: http.client.HTTPConnection):
+        """Return a connection to the pool, closing it when the pool is full"""
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def request(self, path: str, headers: Dict[str, str] = None, sink=None) -> Tuple[int, Dict[str, str], bytes]:
+        """GET a path, streaming the body into sink when given.
+
+        sink is a file opened for appending. A 206 body is appended to it, a
+        200 body replaces its content, so a resume the server ignored is not
+        downloaded twice.
+        """
+        conn, reused = self.acquire()
+        try:
+            conn.request("GET", self.base_path + path, headers=headers or {})
+            response = conn.getresponse()
+        except self.RETRYABLE:
+            # The server closed an idle keep-alive connection, retry on a fresh one
+            conn.close()
+            if not reused:
+                raise
+            conn = self._connect()
+            conn.request("GET", self.base_path + path, headers=headers or {})
+            response = conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+        try:
+            response_headers = {k.lower(): v for k, v in response.getheaders()}
+            body = b""
+            if sink is not None and response.status in (200, 206):
+                if response.status == 200:
+                    sink.seek(0)
+                    sink.truncate()
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sink.write(chunk)
+            else:
+                body = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.release(conn)
+        return response.status, response_headers, body
+
+class ResponseCache:
+    """On-disk cache of ETags and bodies for repository responses"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def load(self, key: str) -> Dict:
+        try:
+            with open(self._key_path(key) + ".json", "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, key: str, meta: Dict, body: Optional[bytes] = None):
+        base = self._key_path(key)
+        if body is not None:
+            with open(base + ".body", "wb") as file:
+                file.write(body)
+        with open(base + ".json", "w") as file:
+            json.dump(meta, file)
+
+    def body(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._key_path(key) + ".body", "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+class ThemeRepositoryClient:
+    """Browses and installs themes from a repository server"""
+
+    def __init__(self, base_url: str, cache_dir: str = None, pool_size: int = 4):
+        self.base_url = base_url.rstrip("/")
+        self.pool = ConnectionPool(self.base_url, size=pool_size)
+        self.pool_size = pool_size
+        if cache_dir is None:
+            cache_dir = cache_path("cache", "")
+        self.cache = ResponseCache(cache_dir)
+
+    def close(self):
+        self.pool.close()
+
+    def fetch(self, path: str) -> bytes:
+        """GET a small resource, revalidating the cached copy with its ETag"""
+        key = self.base_url + path
+        meta = self.cache.load(key)
+        cached_body = self.cache.body(key) if meta.get("etag") else None
+
+        headers = {}
+        if cached_body is not None:
+            headers["If-None-Match"] = meta["etag"]
+
+        status, response_headers, body = self.pool.request(path, headers)
+        if status == 304 and cached_body is not None:
+            return cached_body
+        if status != 200:
+            raise Exception(f"Repository returned {status} for {path}")
+
+        if response_headers.get("etag"):
+            self.cache.store(key, {"etag": response_headers["etag"]}, body)
+        return body
+
+    def list_themes(self) -> List[Dict]:
+        """Fetch the repository catalog"""
+        return json.loads(self.fetch("/api/themes").decode("utf-8"))["themes"]
+
+    def thumbnail(self, theme: Dict) -> bytes:
+        """Fetch the PNG thumbnail of a catalog entry"""
+        return self.fetch(theme["thumbnail"])
+
+    def local_conflict(self, theme: Dict, theme_path: str) -> Optional[str]:
+        """Local theme sharing the name of a repository theme that was not installed from it, if any.
+
+        Installing over it would either list the theme twice, as a folder and
+        a zip, or overwrite a zip the user made.
+        """
+        stem = theme_stem(theme["name"])
+        if os.path.isdir(os.path.join(theme_path, stem)):
+            return stem
+        if os.path.exists(os.path.join(theme_path, stem + ".zip")):
+            if not self.cache.load(self.base_url + theme["archive"]).get("etag"):
+                return stem + ".zip"
+        return None
+
+    def download_theme(self, theme: Dict, theme_path: str) -> bool:
+        """Install a theme as <stem>.zip, returning False when it was already current or clashes with a local theme"""
+        dest = os.path.abspath(os.path.join(theme_path, theme_stem(theme["name"]) + ".zip"))
+        if not dest.startswith(os.path.join(os.path.abspath(theme_path), "")):
+            raise Exception(f"Refusing theme outside the theme directory: {theme['name']}")
+        conflict = self.local_conflict(theme, theme_path)
+        if conflict is not None:
+            logging.warning(f"Skipping theme {theme['name']}, the local theme {conflict} has the same name")
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        key = self.base_url + theme["archive"]
+        meta = self.cache.load(key)
+
+        # Skip the request entirely when the catalog ETag matches what we installed
+        if self._is_current(meta, dest, theme.get("etag")):
+            return False
+
+        headers = {}
+        if meta.get("etag") and os.path.exists(dest) and self._is_current(meta, dest, meta["etag"]):
+            headers["If-None-Match"] = meta["etag"]
+
+        partial = dest + ".part"
+        if os.path.exists(partial) and meta.get("partial_etag"):
+            headers["Range"] = f"bytes={os.path.getsize(partial)}-"
+            headers["If-Range"] = meta["partial_etag"]
+        elif os.path.exists(partial):
+            os.remove(partial)
+
+        expected_etag = theme.get("etag")
+        if expected_etag:
+            self.cache.store(key, dict(meta, partial_etag=expected_etag))
+
+        # A 200 answer to the range request replaces the partial file instead of being fetched again
+        with open(partial, "ab") as sink:
+            status, response_headers, _ = self.pool.request(theme["archive"], headers, sink=sink)
+
+        if status == 304:
+            os.remove(partial)
+            return False
+        if status not in (200, 206):
+            raise Exception(f"Repository returned {status} for {theme['name']}")
+
+        os.replace(partial, dest)
+        st = os.stat(dest)
+        self.cache.store(key, {"etag": response_headers.get("etag", expected_etag),
+                               "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+        logging.info(f"Installed theme {theme['name']} from repository")
+        return True
+
+    def _is_current(self, meta: Dict, dest: str, etag: Optional[str]) -> bool:
+        if not etag or meta.get("etag") != etag:
+            return False
+        try:
+            st = os.stat(dest)
+        except OSError:
+            return False
+        return st.st_size == meta.get("size") and st.st_mtime_ns == meta.get("mtime_ns")
+
+    def download_themes(self, themes: List[Dict], theme_path: str, max_workers: int = None) -> List[str]:
+        """Download several themes in parallel, returning the names that changed"""
+        os.makedirs(theme_path, exist_ok=True)
+        workers = max_workers or self.pool_size
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda t: (t["name"], self.download_theme(t, theme_path)), themes))
+        return [name for name, changed in results if changed]
+
+    def sync(self, config_path: str, names: List[str] = None) -> List[str]:
+        """Bring the local theme directory up to date with the repository"""
+        themes = self.list_themes()
+        if names is not None:
+            wanted = set(names)
+            themes = [t for t in themes if t["name"] in wanted or theme_stem(t["name"]) in wanted]
+        return self.download_themes(themes, os.path.join(config_path, "theme"))
+
+def main():
+    parser = argparse.ArgumentParser(description="BBS theme repository service and client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve <config>/theme over HTTP")
+    serve_parser.add_argument("config", help="BBS config directory")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    list_parser = subparsers.add_parser("list", help="List themes of a repository")
+    list_parser.add_argument("url")
+
+    sync_parser = subparsers.add_parser("sync", help="Install repository themes into <config>/theme")
+    sync_parser.add_argument("url")
+    sync_parser.add_argument("config", help="BBS config directory")
+    sync_parser.add_argument("names", nargs="*", help="Only sync these themes")
+    sync_parser.add_argument("--workers", type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = ThemeRepositoryServer(args.config, args.host, args.port)
+        logging.info(f"Theme repository running at http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    client = ThemeRepositoryClient(args.url, pool_size=getattr(args, "workers", 4))
+    try:
+        if args.command == "list":
+            for theme in client.list_themes():
+                print(f"{theme['name']}\t{theme['kind']}\t{theme['size']}")
+        else:
+            changed = client.sync(args.config, args.names or None)
+            print(f"{len(changed)} theme(s) updated")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
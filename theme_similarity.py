@@ -0,0 +1,238 @@
+"""Perceptual-hash similarity index for finding look-alike themes"""
+import os
+import json
+import heapq
+import hashlib
+import logging
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from theme_catalog import cache_path, list_themes, process_pool
+from theme_images import expanded, open_bounded
+from theme_layers import ThemeResolver
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+COLOR_STEP = 16
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+DCT = _dct_matrix(DCT_SIZE)
+
+def perceptual_hash(img: Image.Image) -> int:
+    """64-bit DCT perceptual hash of an image"""
+    img.draft("L", (DCT_SIZE * 2, DCT_SIZE * 2))
+    # Converted first, reduce() refuses palette, 1 bit and 16 bit images
+    img = expanded(img)
+    if img.mode != "L":
+        img = img.convert("L")
+    factor = max(1, min(img.size) // (DCT_SIZE * 4))
+    if factor > 1:
+        img = img.reduce(factor)
+    pixels = np.asarray(img.resize((DCT_SIZE, DCT_SIZE), Image.BOX), dtype=np.float64)
+
+    coefficients = (DCT @ pixels @ DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    median = np.median(coefficients[1:])
+    bits = coefficients > median
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+def quantize_color(color_int: int) -> Tuple[int, int, int]:
+    """Coarse RGB channels of an ARGB integer"""
+    return (((color_int >> 16) & 0xFF) // COLOR_STEP,
+            ((color_int >> 8) & 0xFF) // COLOR_STEP,
+            (color_int & 0xFF) // COLOR_STEP)
+
+def make_signature(phash: int, primary_color: int, background_color: int) -> Tuple[int, Tuple[int, ...]]:
+    """Signature combining the image hash with both theme colors"""
+    return phash, quantize_color(primary_color) + quantize_color(background_color)
+
+def distance(a: Tuple[int, Tuple[int, ...]], b: Tuple[int, Tuple[int, ...]]) -> int:
+    """Hamming distance of the hashes plus L1 distance of the quantized colors.
+
+    Both parts are metrics, so their sum satisfies the triangle inequality
+    the BK-tree relies on.
+    """
+    return bin(a[0] ^ b[0]).count("1") + sum(abs(x - y) for x, y in zip(a[1], b[1]))
+
+class BKTree:
+    """Burkhard-Keller tree over theme signatures"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key: str, signature):
+        node = [key, signature, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+
+        current = self.root
+        while True:
+            d = distance(signature, current[1])
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def search(self, signature, radius: int) -> List[Tuple[int, str]]:
+        """All keys within radius as (distance, key) pairs"""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = distance(signature, node[1])
+            if d <= radius:
+                results.append((d, node[0]))
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return sorted(results)
+
+    def nearest(self, signature, count: int, exclude: str = None) -> List[Tuple[int, str]]:
+        """The count closest keys, pruning subtrees that cannot beat the current best"""
+        best = []  # max-heap of (-distance, key)
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = distance(signature, node[1])
+            if node[0] != exclude:
+                if len(best) < count:
+                    heapq.heappush(best, (-d, node[0]))
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, (-d, node[0]))
+
+            tau = -best[0][0] if len(best) == count else None
+            for edge, child in node[2].items():
+                if tau is None or d - tau <= edge <= d + tau:
+                    stack.append(child)
+        return sorted((-d, key) for d, key in best)
+
+def _hash_theme(theme_path: str, theme_name: str) -> Dict:
+    """Worker entry point computing the signature parts of one theme merged with its parents"""
+    resolver = ThemeResolver(theme_path)
+    resolved = resolver.resolve(theme_name)
+    colors = resolved.colors
+    data = resolver.read_assets(resolved, ["background.png"]).get("background.png")
+    phash = perceptual_hash(open_bounded(data)) if data is not None else 0
+    return {
+        "phash": phash,
+        "primary_color": colors.get("primary_color", 0),
+        "background_color": colors.get("background_color", 0),
+    }
+
+class SimilarityIndex:
+    """Persistent, incrementally updated look-alike index of a theme directory"""
+
+    def __init__(self, theme_path: str, index_file: str = None):
+        self.theme_path = theme_path
+        if index_file is None:
+            path_key = hashlib.sha1(os.path.abspath(theme_path).encode("utf-8")).hexdigest()[:12]
+            index_file = cache_path(f"similarity-{path_key}.json")
+        self.index_file = index_file
+        self.entries = self.load()
+        self.tree = None
+
+    def load(self) -> Dict:
+        try:
+            with open(self.index_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        temp_path = self.index_file + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(temp_path, self.index_file)
+
+    def update(self, max_workers: int = None) -> int:
+        """Hash new and changed themes in parallel, returning how many were hashed"""
+        names = list_themes(self.theme_path)
+        resolver = ThemeResolver(self.theme_path)
+        pending = []
+        broken = set()
+        for theme_name in names:
+            try:
+                # Covers the parents too, a changed parent rehashes every theme built on it
+                fingerprint = json.loads(json.dumps(resolver.resolve(theme_name).fingerprint))
+            except Exception as e:
+                logging.warning(f"Skipping theme {theme_name}: {e}")
+                broken.add(theme_name)
+                continue
+            entry = self.entries.get(theme_name)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                pending.append((theme_name, fingerprint))
+
+        if pending:
+            with process_pool(max_workers) as executor:
+                futures = [(name, fingerprint, executor.submit(_hash_theme, self.theme_path, name))
+                           for name, fingerprint in pending]
+                for theme_name, fingerprint, future in futures:
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        logging.warning(f"Skipping theme {theme_name}: {e}")
+                        self.entries.pop(theme_name, None)
+                        continue
+                    entry["fingerprint"] = fingerprint
+                    self.entries[theme_name] = entry
+
+        current = set(names) - broken
+        removed = [name for name in self.entries if name not in current]
+        for theme_name in removed:
+            del self.entries[theme_name]
+
+        if pending or removed or self.tree is None:
+            self.build_tree()
+        if pending or removed:
+            self.save()
+        return len(pending)
+
+    def signature(self, theme_name: str):
+        entry = self.entries[theme_name]
+        return make_signature(entry["phash"], entry["primary_color"], entry["background_color"])
+
+    def build_tree(self):
+        self.tree = BKTree()
+        for theme_name in sorted(self.entries):
+            self.tree.add(theme_name, self.signature(theme_name))
+
+    def similar(self, theme_name: str, count: int = 10) -> List[Tuple[int, str]]:
+        """Themes that look most like the given one, closest first"""
+        if self.tree is None:
+            self.build_tree()
+        if theme_name not in self.entries:
+            return []
+        return self.tree.nearest(self.signature(theme_name), count, exclude=theme_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find themes that look like a given theme")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("theme", help="Theme name as shown in the list")
+    parser.add_argument("--count", type=int, default=10)
+    args = parser.parse_args()
+
+    index = SimilarityIndex(os.path.join(args.config, "theme"))
+    index.update()
+    for d, theme_name in index.similar(args.theme, args.count):
+        print(f"{d:3d}  {theme_name}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
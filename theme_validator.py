@@ -0,0 +1,266 @@
+"""Parallel theme validation with a persistent verdict cache"""
+import os
+import io
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import warnings
+import zipfile
+from concurrent.futures import CancelledError, Future
+from typing import Dict, List, Optional, Tuple
+
+from theme_catalog import (CONFIG_FILE, PARENT_KEY, PNG_SIGNATURE, THEME_ASSETS, ThemeSource, cache_path,
+                           content_hash, list_themes, process_pool, theme_disk_size, theme_fingerprint)
+from theme_images import MAX_PIXELS
+from theme_io import INDEXING, charge
+from theme_layers import ThemeLayerError, ThemeResolver
+
+
+def check_config(text: str) -> List[str]:
+    """Problems in the color and parent lines of a config.txt"""
+    errors = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if ":" not in line:
+            continue
+        key, value = line.strip().split(":", 1)
+        if key.strip().strip('"') == PARENT_KEY:
+            if not value.strip().rstrip(',').strip().strip('"'):
+                errors.append(f"config.txt line {number}: parent is empty")
+            continue
+        try:
+            color = int(value.strip().strip(','))
+        except ValueError:
+            errors.append(f"config.txt line {number}: {key.strip()} is not an integer")
+            continue
+        if not -(1 << 31) <= color < (1 << 32):
+            errors.append(f"config.txt line {number}: {key.strip()} is out of range")
+    return errors
+
+def check_png(asset_name: str, data: bytes) -> List[str]:
+    """Problems with a PNG asset, without decoding its pixels"""
+    from PIL import Image
+
+    if not data.startswith(PNG_SIGNATURE):
+        return [f"{asset_name} is not a PNG file"]
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            img = Image.open(io.BytesIO(data))
+        width, height = img.size
+        if width * height > MAX_PIXELS:
+            return [f"{asset_name} is {width}x{height}, above the {MAX_PIXELS} pixel limit"]
+        img.verify()
+    except Image.DecompressionBombError:
+        return [f"{asset_name} is a decompression bomb"]
+    except Exception as e:
+        return [f"{asset_name} is damaged: {e}"]
+    return []
+
+def validate_theme(theme_path: str, theme_name: str,
+                   known_hash: str = None) -> Tuple[Optional[str], Optional[List[str]]]:
+    """Check one theme, returning its content hash and the problems found.
+
+    When the content hash equals known_hash the checks are skipped and None
+    is returned for the problems, so the caller keeps its cached verdict.
+    """
+    try:
+        source = ThemeSource(theme_path, theme_name)
+    except zipfile.BadZipFile as e:
+        return None, [f"Corrupt ZIP file: {e}"]
+    except Exception as e:
+        return None, [str(e)]
+
+    with source:
+        try:
+            digest = content_hash(source)
+        except Exception as e:
+            return None, [f"Unreadable theme: {e}"]
+        if known_hash is not None and digest == known_hash:
+            return digest, None
+
+        errors = []
+        bad_member = source.test_archive()
+        if bad_member is not None:
+            errors.append(f"Corrupt ZIP member {bad_member}")
+        try:
+            errors.extend(check_config(source.read_bytes(CONFIG_FILE).decode("utf-8")))
+        except UnicodeDecodeError:
+            errors.append("config.txt is not valid UTF-8")
+        for asset_name in THEME_ASSETS:
+            data = source.read_bytes(asset_name)
+            if data is not None:
+                errors.extend(check_png(asset_name, data))
+        return digest, errors
+
+class ThemeValidator:
+    """Validates a theme directory, re-checking only themes that changed"""
+
+    def __init__(self, theme_path: str, cache_file: str = None):
+        self.theme_path = theme_path
+        if cache_file is None:
+            path_key = hashlib.sha1(os.path.abspath(theme_path).encode("utf-8")).hexdigest()[:12]
+            cache_file = cache_path(f"validation-{path_key}.json")
+        self.cache_file = cache_file
+        self.resolver = ThemeResolver(theme_path)
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.verdicts = self.load()
+
+    def load(self) -> Dict:
+        try:
+            with open(self.cache_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self.lock:
+            data = dict(self.verdicts)
+        temp_path = self.cache_file + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_file)
+
+    def cached_errors(self, theme_name: str) -> Optional[List[str]]:
+        """Known problems of a theme, or None when it has not been validated"""
+        with self.lock:
+            verdict = self.verdicts.get(theme_name)
+        return None if verdict is None else verdict["errors"]
+
+    def layer_errors(self, theme_name: str) -> List[str]:
+        """Problems in the parent chain of a theme.
+
+        Checked on every run and never cached, the chain depends on other
+        themes that can change without this one changing.
+        """
+        try:
+            self.resolver.resolve(theme_name)
+        except ThemeLayerError as e:
+            return [str(e)]
+        except Exception:
+            # The theme's own problems are reported by validate_theme
+            pass
+        return []
+
+    def cancel(self, scheduler=None):
+        """Stop a running validate(), dropping the scheduler jobs it queued"""
+        self.cancelled = True
+        if scheduler is not None:
+            scheduler.cancel("validation")
+
+    def admit(self, theme_name: str):
+        """Charge the reads of one theme to the scheduler lane running this"""
+        if self.cancelled:
+            raise CancelledError()
+        charge(theme_disk_size(self.theme_path, theme_name))
+
+    def submit_admitted(self, scheduler, executor, theme_name: str, known_hash: Optional[str]) -> Future:
+        """Validate one theme in the worker processes once the scheduler admitted its reads.
+
+        Only the admission holds an indexing lane slot, the check itself runs
+        outside it, so the lane limit does not cap the busy worker processes.
+        """
+        result = Future()
+
+        def on_checked(checked):
+            try:
+                result.set_result(checked.result())
+            except BaseException as e:
+                result.set_exception(e)
+
+        def on_admitted(admission):
+            try:
+                admission.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            executor.submit(validate_theme, self.theme_path, theme_name, known_hash).add_done_callback(on_checked)
+
+        scheduler.submit(INDEXING, self.admit, theme_name, tag="validation").add_done_callback(on_admitted)
+        return result
+
+    def validate(self, max_workers: int = None, on_result=None, scheduler=None) -> Dict[str, List[str]]:
+        """Validate every theme, calling on_result(name, errors) as verdicts arrive.
+
+        With a scheduler, listing and checks go through its indexing lane
+        under the "validation" tag, so cancelling that tag stops the run.
+        """
+        try:
+            names = list_themes(self.theme_path, scheduler, INDEXING, tag="validation")
+        except CancelledError:
+            return {}
+        if self.cancelled:
+            return {}
+        results = {}
+        pending = []
+        for theme_name in names:
+            try:
+                fingerprint = json.loads(json.dumps(theme_fingerprint(self.theme_path, theme_name)))
+            except OSError:
+                continue
+            with self.lock:
+                verdict = self.verdicts.get(theme_name)
+            if verdict is not None and verdict["fingerprint"] == fingerprint:
+                results[theme_name] = verdict["errors"] + self.layer_errors(theme_name)
+            else:
+                pending.append((theme_name, fingerprint, verdict))
+
+        if on_result:
+            for theme_name, errors in results.items():
+                on_result(theme_name, errors)
+
+        if pending:
+            with process_pool(max_workers) as executor:
+                if scheduler is not None:
+                    futures = [(name, fingerprint, verdict, self.submit_admitted(
+                                    scheduler, executor, name, verdict and verdict["hash"]))
+                               for name, fingerprint, verdict in pending]
+                else:
+                    futures = [(name, fingerprint, verdict, executor.submit(
+                                    validate_theme, self.theme_path, name, verdict and verdict["hash"]))
+                               for name, fingerprint, verdict in pending]
+                for theme_name, fingerprint, verdict, future in futures:
+                    try:
+                        digest, errors = future.result()
+                    except CancelledError:
+                        continue
+                    except Exception as e:
+                        digest, errors = None, [f"Validation crashed: {e}"]
+                    if errors is None:
+                        # Touched but unchanged, keep the previous verdict
+                        errors = verdict["errors"]
+                    with self.lock:
+                        self.verdicts[theme_name] = {"fingerprint": fingerprint, "hash": digest, "errors": errors}
+                    errors = errors + self.layer_errors(theme_name)
+                    results[theme_name] = errors
+                    if on_result:
+                        on_result(theme_name, errors)
+
+        with self.lock:
+            for theme_name in list(self.verdicts):
+                if theme_name not in results:
+                    del self.verdicts[theme_name]
+        if pending:
+            self.save()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate every theme in a BBS config directory")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    results = ThemeValidator(os.path.join(args.config, "theme")).validate(args.workers)
+    invalid = {name: errors for name, errors in results.items() if errors}
+    for theme_name, errors in sorted(invalid.items()):
+        print(theme_name)
+        for error in errors:
+            print(f"    {error}")
+    print(f"{len(invalid)} of {len(results)} theme(s) invalid")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
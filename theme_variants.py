@@ -0,0 +1,201 @@
+"""Batch generation of hue-shifted and darkened theme variants"""
+import os
+import io
+import time
+import colorsys
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from theme_catalog import theme_category, theme_stem
+from theme_images import open_bounded
+import theme_operations
+
+# Variants rendered at once; each one holds a full-size RGB buffer and its PNG
+MAX_WORKERS = 4
+
+def parse_variant(text: str) -> Dict:
+    """Parse 'name:hue=30,saturation=0.8,value=0.7' into a variant spec.
+
+    hue is a rotation in degrees, saturation and value are multipliers.
+    """
+    name, _, options = text.partition(":")
+    variant = {"name": name.strip(), "hue": 0.0, "saturation": 1.0, "value": 1.0}
+    if not variant["name"]:
+        raise ValueError(f"Variant needs a name: {text}")
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        key = key.strip()
+        if key not in ("hue", "saturation", "value"):
+            raise ValueError(f"Unknown variant option: {key}")
+        variant[key] = float(value)
+    return variant
+
+def hue_steps(count: int, saturation: float = 1.0, value: float = 1.0) -> List[Dict]:
+    """Variants rotating the hue evenly around the color wheel"""
+    return [{"name": f"hue {round(360 * i / (count + 1))}", "hue": 360 * i / (count + 1),
+             "saturation": saturation, "value": value}
+            for i in range(1, count + 1)]
+
+def transform_color(color_int: int, variant: Dict) -> int:
+    """Apply a variant to an ARGB integer in the same HSV space used for the pixels"""
+    alpha = (color_int >> 24) & 0xFF
+    r, g, b = ((color_int >> 16) & 0xFF) / 255, ((color_int >> 8) & 0xFF) / 255, (color_int & 0xFF) / 255
+    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    h = (h + variant["hue"] / 360) % 1.0
+    s = min(max(s * variant["saturation"], 0.0), 1.0)
+    v = min(max(v * variant["value"], 0.0), 1.0)
+    r, g, b = (int(c * 255 + 0.5) for c in colorsys.hsv_to_rgb(h, s, v))
+    value = (alpha << 24) | (r << 16) | (g << 8) | b
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized colorsys.rgb_to_hsv over an (..., 3) float array in 0-1"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    delta = maxc - rgb.min(axis=-1)
+    safe_delta = np.where(delta > 0, delta, 1)
+
+    s = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1), 0)
+    rc = (maxc - r) / safe_delta
+    gc = (maxc - g) / safe_delta
+    bc = (maxc - b) / safe_delta
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(delta > 0, (h / 6.0) % 1.0, 0)
+    return np.stack([h, s, maxc], axis=-1).astype(np.float32)
+
+def hsv_to_rgb(h: np.ndarray, s: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Vectorized colorsys.hsv_to_rgb returning (..., 3) uint8"""
+    h6 = h * 6.0
+    sector = np.floor(h6)
+    f = h6 - sector
+    sector = sector.astype(np.int8) % 6
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+
+    rgb = np.empty(h.shape + (3,), dtype=np.uint8)
+    for channel, choices in enumerate([(v, q, p, p, t, v), (t, v, v, q, p, p), (p, p, t, v, v, q)]):
+        rgb[..., channel] = np.clip(np.choose(sector, choices) * 255.0 + 0.5, 0, 255)
+    return rgb
+
+class SharedBackground:
+    """A background decoded once and reduced to its distinct colors.
+
+    Variants only transform the distinct colors, in HSV computed once, and
+    map them back to the pixels with a single gather. Photos usually have
+    far fewer distinct colors than pixels, and the result is identical to
+    transforming every pixel.
+    """
+
+    def __init__(self, data: bytes):
+        img = open_bounded(data)
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        pixels = np.asarray(img)
+        self.alpha = pixels[..., 3] if img.mode == "RGBA" else None
+
+        packed = ((pixels[..., 0].astype(np.uint32) << 16)
+                  | (pixels[..., 1].astype(np.uint32) << 8)
+                  | pixels[..., 2])
+        present = np.zeros(1 << 24, dtype=bool)
+        present[packed] = True
+        colors = np.flatnonzero(present).astype(np.uint32)
+        lookup = np.zeros(1 << 24, dtype=np.uint32)
+        lookup[colors] = np.arange(len(colors), dtype=np.uint32)
+        self.index = lookup[packed]
+
+        rgb = np.stack([(colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1)
+        self.hsv = rgb_to_hsv(rgb.astype(np.float32) / 255.0)
+
+    def render(self, variant: Dict) -> bytes:
+        """PNG bytes of the background with the variant applied"""
+        h = self.hsv[:, 0]
+        if variant["hue"]:
+            h = (h + np.float32(variant["hue"] / 360)) % 1.0
+        s = self.hsv[:, 1]
+        if variant["saturation"] != 1.0:
+            s = np.clip(s * np.float32(variant["saturation"]), 0, 1)
+        v = self.hsv[:, 2]
+        if variant["value"] != 1.0:
+            v = np.clip(v * np.float32(variant["value"]), 0, 1)
+
+        rgb = hsv_to_rgb(h, s, v)[self.index]
+        if self.alpha is not None:
+            img = Image.fromarray(np.dstack([rgb, self.alpha]), "RGBA")
+        else:
+            img = Image.fromarray(rgb, "RGB")
+        output = io.BytesIO()
+        # Fast compression, the variants can go through the export optimizer afterwards
+        img.save(output, "PNG", compress_level=1)
+        return output.getvalue()
+
+def generate_variants(theme_path: str, theme_name: str, variants: List[Dict], export_type: str = "zip",
+                      overwrite: bool = False, max_workers: int = MAX_WORKERS) -> List[str]:
+    """Write one theme per variant next to the source theme, returning their paths"""
+    # Variants are written in parallel, two with one name would write the same file at once
+    seen = set()
+    for variant in variants:
+        key = variant["name"].casefold()
+        if key in seen:
+            raise ValueError(f"Duplicate variant name: {variant['name']}")
+        seen.add(key)
+
+    colors, assets = theme_operations.read_theme(theme_path, theme_name)
+    background = SharedBackground(assets["background.png"]) if "background.png" in assets else None
+    # Variants go next to the source theme, in its category folder
+    target_path = os.path.join(theme_path, theme_category(theme_name))
+    stem = os.path.basename(theme_stem(theme_name))
+
+    def write_variant(variant):
+        variant_name = f"{stem} {variant['name']}"
+        target = os.path.join(target_path, f"{variant_name}.zip" if export_type == "zip" else variant_name)
+        if os.path.exists(target) and not overwrite:
+            logging.warning(f"Skipping existing theme {variant_name}")
+            return None
+
+        variant_assets = dict(assets)
+        if background is not None:
+            variant_assets["background.png"] = background.render(variant)
+        return theme_operations.write_theme(
+            target_path, variant_name,
+            transform_color(colors.get("primary_color", 0), variant),
+            transform_color(colors.get("background_color", 0), variant),
+            variant_assets, export_type)
+
+    # NumPy and the PNG encoder release the GIL, so threads share the decoded planes
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [path for path in executor.map(write_variant, variants) if path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate hue-shifted and darkened variants of a theme")
+    parser.add_argument("config", help="BBS config directory")
+    parser.add_argument("theme", help="Theme name as shown in the list")
+    parser.add_argument("--variant", action="append", default=[], metavar="NAME:hue=H,saturation=S,value=V",
+                        help="Variant to generate, can be repeated")
+    parser.add_argument("--hue-steps", type=int, default=0, help="Add this many evenly spaced hue rotations")
+    parser.add_argument("--type", choices=["zip", "folder"], default="zip")
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    variants = [parse_variant(text) for text in args.variant] + hue_steps(args.hue_steps)
+    if not variants:
+        parser.error("give at least one --variant or --hue-steps")
+
+    start = time.perf_counter()
+    try:
+        paths = generate_variants(os.path.join(args.config, "theme"), args.theme, variants,
+                                  args.type, args.overwrite, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    for path in paths:
+        print(path)
+    print(f"{len(paths)} variant(s) written in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
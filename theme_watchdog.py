@@ -0,0 +1,163 @@
+"""Main-loop stall watchdog for the Tk event loop"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+# Upper bounds of the stall histogram buckets in milliseconds, the last one is open
+STALL_BUCKETS = [100, 250, 500, 1000, 2000, 5000, 10000]
+
+# Stalls kept with their stacks in an exported report
+MAX_STALL_RECORDS = 200
+
+def bucket_label(index: int) -> str:
+    if index < len(STALL_BUCKETS):
+        return f"<={STALL_BUCKETS[index]}ms"
+    return f">{STALL_BUCKETS[-1]}ms"
+
+class StallWatchdog:
+    """Detects main-loop stalls from missing root.after heartbeats.
+
+    The main thread records a heartbeat every interval. A background thread
+    checks how old the last heartbeat is and, once it is older than the
+    threshold, captures the main thread's stack while it is still stuck.
+    When the heartbeat resumes the stall duration goes into the histogram.
+    """
+
+    def __init__(self, root, threshold_ms: int = 250, interval_ms: int = 50):
+        self.root = root
+        self.threshold = threshold_ms / 1000
+        self.interval_ms = interval_ms
+        self.main_thread_id = threading.main_thread().ident
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.last_beat = time.perf_counter()
+        self.captured_beat = None
+        self.pending_stall = None
+        self.operations = []
+        self.histogram = [0] * (len(STALL_BUCKETS) + 1)
+        self.by_operation = {}
+        self.stalls = deque(maxlen=MAX_STALL_RECORDS)
+
+    def start(self):
+        self.last_beat = time.perf_counter()
+        self.root.after(self.interval_ms, self.beat)
+        threading.Thread(target=self.monitor, name="stall-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    @contextmanager
+    def operation(self, name: str):
+        """Label the work running on the main thread for stall reports"""
+        self.operations.append(name)
+        try:
+            yield
+        finally:
+            self.operations.pop()
+
+    def current_operation(self) -> str:
+        operations = list(self.operations)
+        return " > ".join(operations) if operations else "idle"
+
+    def beat(self):
+        """Heartbeat, runs on the main thread through root.after"""
+        now = time.perf_counter()
+        previous = self.last_beat
+        self.last_beat = now
+        if self.stop_event.is_set():
+            return
+        self.root.after(self.interval_ms, self.beat)
+
+        stall = now - previous - self.interval_ms / 1000
+        if stall >= self.threshold:
+            with self.lock:
+                captured = self.pending_stall if self.captured_beat == previous else None
+                self.pending_stall = None
+            self.record(stall, captured)
+
+    def monitor(self):
+        """Watchdog thread comparing the heartbeat age with the threshold"""
+        while not self.stop_event.wait(self.interval_ms / 1000):
+            beat = self.last_beat
+            if beat == self.captured_beat or time.perf_counter() - beat < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self.main_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            operation = self.current_operation()
+            with self.lock:
+                self.captured_beat = beat
+                self.pending_stall = {"operation": operation, "stack": stack}
+            logging.warning(f"Main loop stalled for over {self.threshold * 1000:.0f} ms during {operation}:\n"
+                            + "".join(stack))
+
+    def record(self, stall: float, captured: Optional[Dict]):
+        duration_ms = stall * 1000
+        index = next((i for i, bound in enumerate(STALL_BUCKETS) if duration_ms <= bound), len(STALL_BUCKETS))
+        operation = captured["operation"] if captured else self.current_operation()
+        with self.lock:
+            self.histogram[index] += 1
+            self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+            self.stalls.append({
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "duration_ms": round(duration_ms, 1),
+                "operation": operation,
+                "stack": captured["stack"] if captured else [],
+            })
+        logging.info(f"Main loop stall of {duration_ms:.0f} ms during {operation}")
+
+    def report(self) -> Dict:
+        with self.lock:
+            return {
+                "threshold_ms": round(self.threshold * 1000),
+                "histogram": {bucket_label(i): count for i, count in enumerate(self.histogram)},
+                "by_operation": dict(self.by_operation),
+                "stalls": list(self.stalls),
+            }
+
+    def export(self, path: str) -> bool:
+        """Write the stall report as JSON, returning False when there was nothing to report"""
+        report = self.report()
+        if not report["stalls"]:
+            return False
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(report, file, indent=2)
+        os.replace(temp_path, path)
+        return True
+
+def print_report(report: Dict, show_stacks: bool = False):
+    print(f"Stalls over {report['threshold_ms']} ms")
+    total = sum(report["histogram"].values())
+    for label, count in report["histogram"].items():
+        bar = "#" * round(40 * count / total) if total else ""
+        print(f"  {label:>9}  {count:5d}  {bar}")
+    print("By operation")
+    for operation, count in sorted(report["by_operation"].items(), key=lambda item: -item[1]):
+        print(f"  {count:5d}  {operation}")
+
+    if show_stacks:
+        for stall in report["stalls"]:
+            print(f"\n{stall['time']}  {stall['duration_ms']} ms  {stall['operation']}")
+            print("".join(stall["stack"]).rstrip())
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a stall report written by the theme tool")
+    parser.add_argument("report", help="Stall report JSON file")
+    parser.add_argument("--stacks", action="store_true", help="Print the captured stack of every stall")
+    args = parser.parse_args()
+
+    with open(args.report, "r") as file:
+        print_report(json.load(file), args.stacks)
+
+if __name__ == "__main__":
+    main()